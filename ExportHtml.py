@@ -24,24 +24,86 @@ Original code has been heavily modifed by Isaac Muse <isaacmuse@gmail.com> for t
 """
 import sublime
 import sublime_plugin
+import os
 from os import path
 import tempfile
+import shutil
 import time
-import re
+import traceback
+import hashlib
+import math
 from .HtmlAnnotations import get_annotations
 from .lib.browser import open_in_browser
+from .lib.buffer import BufferSnapshot, ViewBuffer
+from .lib.html_encoder import HtmlEncoder
+from .lib.intervals import IntervalIndex, intersects
+from .lib.line_cache import LineCache, LineCacheStore, LINE_OVERHEAD, get_signature
+from .lib.native import split_lines
 from .lib.color_scheme_matcher import ColorSchemeMatcher
 from .lib.color_scheme_tweaker import ColorSchemeTweaker, ColorTweaker
-from .lib.notify import notify
+from .lib.notify import notify, error
+from .lib.document import Document, ScopeTable, StyleTable
+from .lib.render import LineRenderer, ChunkedRenderer, ANNOTATE_CLOSE, CONTENT, CHUNK_LINES
+from .lib.style_cache import StyleCache
+from .lib.scope_runs import get_scope_runs, resolve_engine, sample_scope, single_scope
+from .lib.writer import PipelinedWriter, CountingWriter
 from mdpopups import jinja2
 from collections import namedtuple
 
 AUTO = int(sublime.version()) >= 4095
+UNLISTED_PANELS = int(sublime.version()) >= 4050
+TEXT_CHANGES = hasattr(getattr(sublime_plugin, 'TextChangeListener', None), 'is_applicable')
 
 JS_DIR = ""
 
 PACKAGE_SETTINGS = "ExportHtml.sublime-settings"
 
+# Size of body content kept in memory before spooling to disk
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Number of lines between checks for cancellation and buffer changes
+PROGRESS_LINES = 500
+
+# Minimum number of seconds between progress reports in the status bar
+PROGRESS_INTERVAL = 0.5
+
+# Number of times an export is restarted because the buffer changed before giving up
+MAX_RESTARTS = 3
+
+# Number of characters of a long line captured and written at a time
+LONG_LINE_SLICE = 16 * 1024
+
+# Number of points sampled to check if a view appears to only have one scope
+UNIFORM_SAMPLES = 64
+
+# Number of lines of a single scope view converted at a time
+UNIFORM_BATCH_LINES = 1024
+
+# Number of lines the native engine exports with one call
+NATIVE_BLOCK_LINES = 2000
+
+# Degradation tiers of a budgeted export: full detail, no highlights or annotations, and plain text
+BUDGET_TIERS = ('full', 'reduced', 'plain')
+BUDGET_FULL = 0
+BUDGET_REDUCED = 1
+BUDGET_PLAIN = 2
+
+# Share of the export budget after which the rest of the export is plain text
+# (highlights and annotations are dropped once the whole budget is used)
+BUDGET_PLAIN_FACTOR = 2
+
+# Exports currently running on the async thread (keyed by view ID)
+EXPORTS = {}
+
+# Rendered lines of the last export of each view (keyed by view ID)
+LINE_CACHE = LineCacheStore()
+
+# Hidden panels that resolve styles against an alternate color scheme (keyed by window ID and scheme)
+SCHEME_PANELS = {}
+
+# Resources a color scheme and its overrides can be defined in
+SCHEME_EXTENSIONS = ('.sublime-color-scheme', '.hidden-color-scheme', '.tmTheme', '.hidden-tmTheme')
+
 # HTML Code
 HTML_HEADER = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01//EN" "http://www.w3.org/TR/html4/strict.dtd">
 <html>
@@ -128,12 +190,6 @@ TOOL_WRAPPING = (
 
 TOOLBAR = '<div id="toolbarhide"><div id="toolbar">%(options)s</div></div>'
 
-ANNOTATE_OPEN = (
-    '<span onclick="toggle_annotations();" class="tooltip_hotspot" onmouseover="tooltip.show(%(comment)s);" '
-    'onmouseout="tooltip.hide();">%(code)s'
-)
-ANNOTATE_CLOSE = '</span>'
-
 BODY_START = '<body class="code_page code_text"><pre class="code_page">'
 BODY_END = '</pre>%(toolbar)s\n%(js)s\n</body>\n</html>\n'
 
@@ -167,17 +223,18 @@ CODE_LINE = (
     '%(line)s</span><span id="C_%(table)d_%(code_id)d" class="code_line">%(code)s</span>\n'
 )
 
-CODE = '<span class="%(class)s" style="background-color: %(highlight)s; color: %(color)s;">%(content)s</span>'
-ANNOTATION_CODE = (
-    '<span style="background-color: %(highlight)s;"><a href="javascript:void();" class="annotation">'
-    '<span class="%(class)s annotation" style="color: %(color)s;">%(content)s</span></a></span>'
-)
+STYLE_CLASS = '.%(style_class)s { background-color: %(highlight)s; color: %(color)s; }\n'
+ANNOTATION_STYLE_CLASS = '.%(style_class)s .annotation { color: %(color)s; }\n'
 
 ROW_START = '<tr><td>'
 ROW_END = '</td></tr>'
 
+WRAP_HINT = '<wbr>'
+
 DIVIDER = '\n<span style="color: %(color)s">...</span>\n\n'
 
+BUDGET_MARKER = '<!-- ExportHtml: export budget exceeded at line %(line)d, continuing with tier "%(tier)s" -->'
+
 ANNOTATION_TBL_START = (
     '<div id="comment_list" style="display:none"><div id="comment_wrapper">' +
     '<table id="comment_table">' +
@@ -248,6 +305,14 @@ HTML_JS_WRAP = '''
 '''
 
 
+class ExportCancelled(Exception):
+    """The export was cancelled."""
+
+
+class ExportChanged(Exception):
+    """The buffer was changed during the export."""
+
+
 class SchemeColors(
     namedtuple(
         'SchemeColors',
@@ -259,6 +324,94 @@ class SchemeColors(
     """Scheme colors."""
 
 
+def compile_template(template, dynamic, **static):
+    """Compile a `%` dictionary template into a positional format string, filling in the static values."""
+
+    values = dict(static)
+    for index, name in enumerate(dynamic):
+        template = template.replace('%%(%s)d' % name, '%%(%s)s' % name)
+        values[name] = '\x00%d\x00' % index
+    parts = (template % values).split('\x00')
+    if [int(x) for x in parts[1::2]] != list(range(len(dynamic))):
+        raise ValueError(
+            "Line template fields must appear once each, in the order: %s" % ', '.join(dynamic)
+        )
+    return '%s'.join([p.replace('%', '%%') for p in parts[0::2]])
+
+
+def is_same_scheme(scheme1, scheme2):
+    """Check if the color schemes are the same (a file name matches any path to a file of that name)."""
+
+    if scheme1 == scheme2:
+        return True
+    if not isinstance(scheme1, str) or not isinstance(scheme2, str) or ('/' in scheme1 and '/' in scheme2):
+        return False
+    return path.basename(scheme1) == path.basename(scheme2)
+
+
+def get_scheme_view(window, scheme):
+    """Get a hidden panel of the window that uses the color scheme."""
+
+    # Drop the panels of closed windows
+    for k in [k for k, v in SCHEME_PANELS.items() if not v.is_valid()]:
+        del SCHEME_PANELS[k]
+
+    key = (window.id(), scheme)
+    panel = SCHEME_PANELS.get(key)
+    if panel is None:
+        name = 'exporthtml_scheme_%s' % hashlib.md5(scheme.encode('utf-8')).hexdigest()
+        if UNLISTED_PANELS:
+            # Keep the panel out of the panel switcher
+            panel = window.create_output_panel(name, unlisted=True)
+        else:
+            panel = window.create_output_panel(name)
+        panel.settings().set('color_scheme', scheme)
+        SCHEME_PANELS[key] = panel
+    return panel
+
+
+def export_view(view, **kwargs):
+    """Export the view, either on the async thread (`async_export`) or blocking the UI."""
+
+    if view.id() in EXPORTS:
+        notify("An export of this view is already running")
+        return
+
+    exporter = ExportHtml(view)
+    if sublime.load_settings(PACKAGE_SETTINGS).get("async_export", True):
+        exporter.report_progress = True
+        EXPORTS[view.id()] = exporter
+        sublime.set_timeout_async(lambda: exporter.run(**kwargs), 0)
+    else:
+        exporter.run(**kwargs)
+
+
+def benchmark_view(view, presets):
+    """Time the export presets on the view with the Python and the native engine."""
+
+    rows = []
+    try:
+        for name, args in presets:
+            python_time = ExportHtml(view, 'python').benchmark(**args)
+            exporter = ExportHtml(view, 'native')
+            native_time = exporter.benchmark(**args)
+            if exporter.native:
+                rows.append((name, python_time, native_time, '%.1fx' % (python_time / max(native_time, 0.001))))
+            else:
+                rows.append((name, python_time, native_time, 'fallback'))
+    except Exception as e:
+        traceback.print_exc()
+        error("Benchmark failed: %s" % e)
+        sublime.status_message('ExportHtml: Benchmark failed')
+        return
+
+    print('ExportHtml: Benchmark of %s (%d lines)' % (view.file_name() or 'Untitled', view.rowcol(view.size())[0] + 1))
+    print('%-40s %10s %10s %10s' % ('Preset', 'Python', 'Native', 'Speedup'))
+    for row in rows:
+        print('%-40s %9.2fs %9.2fs %10s' % row)
+    sublime.status_message('ExportHtml: Benchmark done, see the console for the results')
+
+
 def getjs(file_name):
     """Get JS file."""
 
@@ -296,7 +449,7 @@ class ExportHtmlPanelCommand(sublime_plugin.WindowCommand):
         if value >= 0:
             view = self.window.active_view()
             if view is not None:
-                ExportHtml(view).run(**self.args[value])
+                export_view(view, **self.args[value])
 
     def run(self):
         """Run command."""
@@ -324,7 +477,68 @@ class ExportHtmlCommand(sublime_plugin.WindowCommand):
 
         view = self.window.active_view()
         if view is not None:
-            ExportHtml(view).run(**kwargs)
+            export_view(view, **kwargs)
+
+
+class ExportHtmlCancelCommand(sublime_plugin.WindowCommand):
+    """Cancel the running export of the active view (or all running exports)."""
+
+    def run(self):
+        """Run command."""
+
+        view = self.window.active_view()
+        if view is not None and view.id() in EXPORTS:
+            exports = [EXPORTS[view.id()]]
+        else:
+            exports = list(EXPORTS.values())
+        for exporter in exports:
+            exporter.cancel()
+
+    def is_enabled(self):
+        """Check if there are exports to cancel."""
+
+        return len(EXPORTS) > 0
+
+
+class ExportHtmlBenchmarkCommand(sublime_plugin.WindowCommand):
+    """Time the export presets of the panel on the active view with each export engine."""
+
+    def run(self):
+        """Run command."""
+
+        view = self.window.active_view()
+        if view is not None:
+            # The presets of the menu use their own color schemes, so the default options are timed as well
+            presets = [('Default options', {})] + [
+                list(opt.items())[0] for opt in sublime.load_settings(PACKAGE_SETTINGS).get("html_panel", [])
+            ]
+            sublime.status_message('ExportHtml: Running benchmark...')
+            sublime.set_timeout_async(lambda: benchmark_view(view, presets), 0)
+
+
+if TEXT_CHANGES:
+    class ExportHtmlTextListener(sublime_plugin.TextChangeListener):
+        """Record the rows edited in views with cached export lines."""
+
+        @classmethod
+        def is_applicable(cls, buffer):
+            """Listen to every buffer, as any view can be exported later."""
+
+            return True
+
+        def on_text_changed(self, changes):
+            """Record the changes in the caches of the views of the buffer."""
+
+            LINE_CACHE.record_changes(self.buffer, changes)
+
+
+class ExportHtmlListener(sublime_plugin.EventListener):
+    """Drop the cached export lines of closed views."""
+
+    def on_close(self, view):
+        """Drop the cached lines of the view."""
+
+        LINE_CACHE.pop(view.id())
 
 
 class OpenHtml:
@@ -346,18 +560,33 @@ class OpenHtml:
         return self.file
 
     def __exit__(self, type, value, traceback):  # noqa: A002
-        """Tear down HTML file."""
+        """Tear down HTML file (removing it if the export failed)."""
 
         self.file.close()
+        if type is not None:
+            try:
+                os.remove(self.file.name)
+            except OSError:
+                pass
 
 
 class ExportHtml(object):
     """ExportHtml."""
 
-    def __init__(self, view):
+    def __init__(self, view, engine=None):
         """Initialization."""
 
         self.view = view
+        self.engine = engine
+        self.cancelled = False
+        self.restarts = 0
+        self.report_progress = False
+        self.benchmarking = False
+        self.switch = False
+        self.stats = {
+            "lines": 0, "seconds": 0.0, "tier": BUDGET_TIERS[BUDGET_FULL], "memo_hit_rate": 0.0,
+            "reused_lines": 0, "engine": "python"
+        }
 
     def process_inputs(self, **kwargs):
         """Process the user inputs."""
@@ -382,7 +611,11 @@ class ExportHtml(object):
             "shift_brightness": bool(kwargs.get("shift_brightness", False)),
             "filter": kwargs.get("filter", ""),
             "disable_nbsp": kwargs.get('disable_nbsp', False),
-            "table_mode": kwargs.get("table_mode", True)
+            "table_mode": kwargs.get("table_mode", True),
+            "style_classes": bool(kwargs.get("style_classes", False)),
+            "coalesce_runs": bool(kwargs.get("coalesce_runs", False)),
+            "absorb_whitespace": bool(kwargs.get("absorb_whitespace", False)),
+            "elide_default_style": bool(kwargs.get("elide_default_style", False))
         }
 
     def setup(self, **kwargs):
@@ -410,6 +643,14 @@ class ExportHtml(object):
         self.date_time_format = kwargs["date_time_format"]
         self.time = time.localtime()
         self.disable_nbsp = kwargs["disable_nbsp"]
+        self.encoder = HtmlEncoder(self.tab_size, self.disable_nbsp)
+        self.style_classes = kwargs["style_classes"]
+        self.style_class_map = {}
+        self.annotation_style_classes = set()
+        self.coalesce_runs = kwargs["coalesce_runs"]
+        self.absorb_whitespace = kwargs["absorb_whitespace"]
+        self.elide_default_style = kwargs["elide_default_style"]
+        self.line_bground = ''
         self.show_full_path = kwargs["show_full_path"]
         self.sels = []
         self.ignore_selections = kwargs["ignore_selections"]
@@ -427,7 +668,13 @@ class ExportHtml(object):
         self.wrap = 900 if not self.auto_wrap else int(kwargs["wrap"])
         self.hl_continue = None
         self.curr_hl = None
-        self.size = self.view.size()
+        self.change_count = self.view.change_count()
+        self.total_lines = 0
+        if eh_settings.get("buffer_snapshot", False):
+            self.buffer = BufferSnapshot.from_view(self.view)
+        else:
+            self.buffer = ViewBuffer(self.view)
+        self.size = self.buffer.size()
         self.pt = 0
         self.end = 0
         self.curr_row = 0
@@ -442,6 +689,26 @@ class ExportHtml(object):
         self.annot_tbl = []
         self.toolbar = kwargs["toolbar"]
         self.legacy = eh_settings.get('legacy_color_matcher', False)
+        self.scope_engine = resolve_engine(self.view, eh_settings.get('scope_engine', 'auto'))
+        self.long_line_threshold = int(eh_settings.get('long_line_threshold', 65536))
+        self.long_line_wrap_hints = bool(eh_settings.get('long_line_wrap_hints', False))
+        self.uniform_scope = sample_scope(
+            self.view, 0, self.view.size(), UNIFORM_SAMPLES
+        ) if eh_settings.get('uniform_scope_fast_path', True) else None
+        self.pipelined_write = bool(eh_settings.get('pipelined_write', True))
+        budget = eh_settings.get('export_budget', {})
+        self.budget = {
+            key: float(budget[key]) for key in ('bytes', 'lines', 'seconds') if budget.get(key, 0) > 0
+        } if isinstance(budget, dict) else {}
+        self.tier = BUDGET_FULL
+        self.budget_output = None
+        # Benchmarks time exports from scratch, without the lines and styles of earlier exports
+        self.incremental = not self.benchmarking and bool(eh_settings.get('incremental_export', True))
+        self.incremental_limit = int(eh_settings.get('incremental_cache_mb', 64)) * 1024 * 1024
+        self.line_cache = None
+        self.new_lines = None
+        self.line_runs = []
+        self.run_idx = 0
         if eh_settings.get("toolbar_orientation", "horizontal") == "vertical":
             self.toolbar_orientation = "block"
         else:
@@ -464,12 +731,13 @@ class ExportHtml(object):
                 alt_scheme = False
 
         switch = False
+        self.style_view = self.view
         view_scheme = self.view.settings().get('color_scheme')
         default = sublime.load_settings('Preferences.sublime-settings')
         self.switch = False
         self.save_to_view = False
         self.view_scheme = view_scheme
-        if isinstance(alt_scheme, str) and alt_scheme != view_scheme:
+        if isinstance(alt_scheme, str) and not is_same_scheme(alt_scheme, view_scheme):
             switch = True
             if view_scheme != default.get('color_scheme'):
                 self.save_to_view = True
@@ -481,13 +749,13 @@ class ExportHtml(object):
             info = sublime.ui_info()
             scheme_file = info['color_scheme']['resolved_value']
 
-        self.highlights = []
-        if self.highlight_selections:
-            for sel in self.view.sel():
-                if not sel.empty():
-                    self.highlights.append(sel)
+        self.highlights = IntervalIndex(
+            (sel.begin(), sel.end()) for sel in self.view.sel() if not sel.empty()
+        ) if self.highlight_selections else IntervalIndex()
 
         self.tweak_cache = {}
+        self.style_memo = {}
+        self.scheme_style = {}
         self.tweaker = ColorTweaker(kwargs["filter"])
 
         if self.legacy:
@@ -505,13 +773,113 @@ class ExportHtml(object):
                 self.gfground = self.fground
                 self.gbground = self.bground
         else:
-            self.switch = switch
-            if self.switch:
-                self.view.settings().set('color_scheme', scheme_file)
-            self.fground = self.tweak(self.view.style().get('foreground'), None)[0]
-            self.bground = self.tweak(None, self.view.style().get('background'))[1]
-            self.gfground = self.tweak(self.view.style().get('gutter_foreground', self.fground), None)[0]
-            self.gbground = self.tweak(None, self.view.style().get('gutter', self.bground))[1]
+            if switch:
+                window = self.view.window() or sublime.active_window()
+                if window is not None:
+                    self.style_view = get_scheme_view(window, scheme_file)
+                else:
+                    # No window to hold the panel, so switch the scheme of the view for the export
+                    self.switch = True
+                    self.view.settings().set('color_scheme', scheme_file)
+            self.scheme_style = self.style_view.style()
+            self.fground = self.tweak(self.scheme_style.get('foreground'), None)[0]
+            self.bground = self.tweak(None, self.scheme_style.get('background'))[1]
+            self.gfground = self.tweak(self.scheme_style.get('gutter_foreground', self.fground), None)[0]
+            self.gbground = self.tweak(None, self.scheme_style.get('gutter', self.bground))[1]
+
+        self.styles = StyleTable()
+        self.scopes = ScopeTable()
+        self.renderer = LineRenderer(
+            {
+                "tab_size": self.tab_size,
+                "disable_nbsp": self.disable_nbsp,
+                "coalesce_runs": self.coalesce_runs,
+                "absorb_whitespace": self.absorb_whitespace,
+                "elide_default_style": self.elide_default_style,
+                "fground": self.fground,
+                "bground": self.bground,
+                "table_mode": self.table_mode,
+                "line_memo_size": int(eh_settings.get('line_memo_size', 4096))
+            },
+            self.get_style_class if self.style_classes else None
+        )
+
+        # Start with the styles resolved by earlier exports with the same scheme, filter, and syntax
+        self.style_cache = None
+        style_cache_size = int(eh_settings.get('style_cache_size', 64))
+        if style_cache_size > 0 and not self.benchmarking:
+            self.style_cache = StyleCache(path.join(sublime.cache_path(), 'ExportHtml', 'styles'), style_cache_size)
+            self.style_cache_key = self.get_style_cache_key(scheme_file, kwargs["filter"])
+            # The cache is keyed by scope name, the memo by the ID of the scope
+            for scope, (normal, selected) in self.style_cache.load(self.style_cache_key).items():
+                self.style_memo[self.scopes.get_id(scope)] = (SchemeColors(*normal), SchemeColors(*selected))
+        self.cached_styles = len(self.style_memo)
+
+        engine = eh_settings.get('export_engine', 'python') if self.engine is None else self.engine
+        self.native = engine == 'native' and self.check_native_engine(switch, kwargs["filter"])
+        if self.native:
+            self.stats["engine"] = "native"
+
+        # Everything besides the text and scopes that decides how a line is rendered
+        self.cache_key = (
+            tuple(sorted(self.renderer.options.items())), scheme_file, kwargs["filter"], self.legacy,
+            self.no_bold, self.no_italic, tuple(sorted(self.scheme_style.items()))
+        )
+
+    def get_style_cache_key(self, scheme_file, color_filter):
+        """Get the key of the resolved styles in the style cache from the scheme and the contents of its resources."""
+
+        scheme_file = scheme_file or ''
+        name = path.splitext(path.basename(scheme_file))[0]
+        digest = hashlib.sha1()
+        for ext in SCHEME_EXTENSIONS:
+            for resource in sorted(sublime.find_resources(name + ext)):
+                digest.update(resource.encode('utf-8'))
+                try:
+                    digest.update(sublime.load_resource(resource).encode('utf-8'))
+                except IOError:
+                    pass
+        return [
+            sublime.version(), scheme_file, digest.hexdigest(), color_filter, self.view.settings().get('syntax'),
+            self.legacy, self.no_bold, self.no_italic, sorted(self.scheme_style.items())
+        ]
+
+    def save_style_cache(self):
+        """Save the styles resolved by the export to the style cache."""
+
+        names = self.scopes.names
+        styles = {}
+        for scope_id, (normal, selected) in self.style_memo.items():
+            styles[names[scope_id]] = (
+                (normal.fg_simulated, normal.bg_simulated, normal.style),
+                (selected.fg_simulated, selected.bg_simulated, selected.style)
+            )
+        try:
+            self.style_cache.save(self.style_cache_key, styles)
+        except OSError:
+            traceback.print_exc()
+            print('ExportHtml: Could not save the style cache')
+
+    def check_native_engine(self, switch, color_filter):
+        """Check if the export can use the native HTML export of the view (`export_engine`)."""
+
+        unsupported = (
+            ('this version of Sublime Text', not hasattr(self.view, 'export_to_html')),
+            ('the legacy color matcher', self.legacy),
+            ('an alternate color scheme', switch),
+            ('color filters', bool(color_filter)),
+            ('highlighted selections', len(self.highlights) > 0),
+            ('multi-select', self.multi_select),
+            ('annotations', len(self.annotations) > 0),
+            ('style classes', self.style_classes),
+            ('the no_bold and no_italic font options', self.no_bold or self.no_italic),
+            ('an export budget', bool(self.budget))
+        )
+        for name, found in unsupported:
+            if found:
+                print('ExportHtml: The native engine does not support %s, using the Python engine' % name)
+                return False
+        return True
 
     def tweak(self, color1, color2):
         """Tweak color."""
@@ -523,40 +891,66 @@ class ExportHtml(object):
         self.tweak_cache[key] = value
         return value
 
-    def guess_style(self, scope, selected=False, no_bold=False, no_italic=False, explicit_background=False):
-        """Guess color."""
+    def guess_style(self, scope_id, selected=False):
+        """Get the colors and font style of the scope (by its ID in the scope table)."""
+
+        # The normal and the selected style are resolved together on the first lookup and kept for the export
+        styles = self.style_memo.get(scope_id)
+        if styles is None:
+            styles = self.style_memo[scope_id] = self.resolve_style(self.scopes.names[scope_id])
+        return styles[selected]
+
+    def resolve_style(self, scope):
+        """Resolve the normal and the selected style of the scope."""
 
         if self.legacy:
-            return self.csm.guess_color(scope, selected, no_bold, no_italic, explicit_background)
-        else:
-            # Remove leading '.' to account for old style CSS
-            scope_style = self.view.style_for_scope(scope.lstrip('.'))
-            style = {}
-            style['foreground'] = scope_style['foreground']
-            style['background'] = scope_style.get('background')
-            style['bold'] = scope_style.get('bold', False) and not no_bold
-            style['italic'] = scope_style.get('italic', False) and not no_italic
-            style['underline'] = scope_style.get('underline', False)
-            style['glow'] = scope_style.get('glow', False)
-
-            font_styles = []
-            for k, v in style.items():
-                if k in ('bold', 'italic', 'underline', 'glow'):
-                    if v is True:
-                        font_styles.append(k)
-            font_styles = ' '.join(font_styles)
-
-            defaults = self.view.style()
-            if not explicit_background and not style.get('background'):
-                style['background'] = defaults.get('background', '#FFFFFF')
-            if selected:
-                sfg = scope_style.get('selection_foreground', defaults.get('selection_foreground'))
-                if sfg != '#00000000':
-                    style['foreground'] = sfg
-                style['background'] = defaults.get('selection', '#0000FF')
-
-            fg, bg = self.tweak(style['foreground'], style['background'])
-            return SchemeColors(fg, bg, font_styles)
+            return (
+                self.csm.guess_color(scope, False, no_bold=self.no_bold, no_italic=self.no_italic),
+                self.csm.guess_color(scope, True, no_bold=self.no_bold, no_italic=self.no_italic)
+            )
+
+        # Remove leading '.' to account for old style CSS
+        scope_style = self.style_view.style_for_scope(scope.lstrip('.'))
+        defaults = self.scheme_style
+        font_styles = ' '.join(
+            [
+                name for name, allowed in (
+                    ('bold', not self.no_bold), ('italic', not self.no_italic), ('underline', True), ('glow', True)
+                ) if allowed and scope_style.get(name, False) is True
+            ]
+        )
+
+        foreground = scope_style['foreground']
+        background = scope_style.get('background') or defaults.get('background', '#FFFFFF')
+        fg, bg = self.tweak(foreground, background)
+
+        selection_foreground = scope_style.get('selection_foreground', defaults.get('selection_foreground'))
+        if selection_foreground != '#00000000':
+            foreground = selection_foreground
+        sfg, sbg = self.tweak(foreground, defaults.get('selection', '#0000FF'))
+        return SchemeColors(fg, bg, font_styles), SchemeColors(sfg, sbg, font_styles)
+
+    def get_style_class(self, color, bgcolor, annotate=False):
+        """Intern the colors as a short style class name."""
+
+        key = (color, bgcolor)
+        name = self.style_class_map.get(key)
+        if name is None:
+            name = 's%d' % len(self.style_class_map)
+            self.style_class_map[key] = name
+        if annotate:
+            self.annotation_style_classes.add(name)
+        return name
+
+    def get_style_class_css(self):
+        """Get the stylesheet for the interned style classes."""
+
+        css = []
+        for (color, bgcolor), name in self.style_class_map.items():
+            css.append(STYLE_CLASS % {"style_class": name, "highlight": bgcolor, "color": color})
+            if name in self.annotation_style_classes:
+                css.append(ANNOTATION_STYLE_CLASS % {"style_class": name, "color": color})
+        return ''.join(css)
 
     def get_tools(self, tools, use_annotation, use_wrapping):
         """Get tools for toolbar."""
@@ -592,7 +986,7 @@ class ExportHtml(object):
                 )
             )
         ):
-            self.size = self.view.size()
+            self.size = self.buffer.size()
             self.pt = 0
             self.end = 1
             self.curr_row = 1
@@ -600,10 +994,32 @@ class ExportHtml(object):
             self.size = curr_sel.end()
             self.pt = curr_sel.begin()
             self.end = self.pt + 1
-            self.curr_row = self.view.rowcol(self.pt)[0] + 1
+            self.curr_row = self.buffer.rowcol(self.pt)[0] + 1
         self.start_line = self.curr_row
 
-        self.gutter_pad = len(str(self.view.rowcol(self.size)[0])) + 1
+        self.gutter_pad = len(str(self.buffer.rowcol(self.size)[0])) + 1
+        self.compile_line_template()
+
+    def compile_line_template(self):
+        """Compile the line template and gutter padding for the current print block."""
+
+        space = ' ' if self.disable_nbsp else '&nbsp;'
+        if self.table_mode:
+            line_template = compile_template(
+                TABLE_LINE, ("line_id", "line", "pad_color", "code_id", "code"),
+                table=self.tables, color=self.gfground, bgcolor=self.gbground
+            )
+        else:
+            line_template = compile_template(
+                CODE_LINE, ("line_id", "line", "code_id", "code"),
+                table=self.tables, color=self.gfground, bgcolor=self.gbground
+            )
+        self.renderer.set_line_template(
+            line_template,
+            [space * (self.gutter_pad - x) for x in range(self.gutter_pad + 1)],
+            space,
+            self.gutter_pad
+        )
 
     def check_sel(self):
         """Check if selection is a multi-selection."""
@@ -615,34 +1031,6 @@ class ExportHtml(object):
                 self.sels.append(sel)
         return multi
 
-    def print_line(self, line, num):
-        """Print the line."""
-
-        line_text = str(num).rjust(self.gutter_pad) + ' '
-        if self.table_mode:
-            html_line = TABLE_LINE % {
-                "line_id": num,
-                "color": self.gfground,
-                "bgcolor": self.gbground,
-                "line": (line_text.replace(" ", '&nbsp;') if not self.disable_nbsp else line_text),
-                "code_id": num,
-                "code": line,
-                "table": self.tables,
-                "pad_color": self.ebground or self.bground
-            }
-        else:
-            html_line = CODE_LINE % {
-                "line_id": num,
-                "color": self.gfground,
-                "bgcolor": self.gbground,
-                "line": (line_text.replace(" ", '&nbsp;') if not self.disable_nbsp else line_text),
-                "code_id": num,
-                "code": line,
-                "table": self.tables
-            }
-
-        return html_line
-
     def write_header(self, html):
         """Write the HTML header."""
 
@@ -663,7 +1051,7 @@ class ExportHtml(object):
                     "dot_color": self.fground,
                     "toolbar_orientation": self.toolbar_orientation
                 }
-            )
+            ) + self.get_style_class_css()
         }
 
         header_vars['js'] = HTML_JS_WRAP % {
@@ -673,50 +1061,324 @@ class ExportHtml(object):
         header = HTML_HEADER % header_vars
         html.write(header)
 
+    def get_chunked_renderer(self, html):
+        """Get a renderer for chunks of captured lines."""
+
+        # A byte budget is checked against the output, so rendered lines are written out right away
+        return ChunkedRenderer(
+            self.renderer, self.styles, html.write, chunk_lines=1 if 'bytes' in self.budget else CHUNK_LINES
+        )
+
+    def start_line_cache(self):
+        """Pick up the lines rendered by the last export of the view (`incremental_export`)."""
+
+        # Only exports of the whole view are cached, and only if a line is rendered from nothing but
+        # its text and scopes (no highlights, annotations, style classes, or budget)
+        if (
+            not self.incremental or self.native or self.pt != 0 or self.size != self.buffer.size() or
+            len(self.highlights) or len(self.annotations) or self.style_classes or self.budget or
+            # The rendered lines are larger than the text, so they would not be kept
+            self.size > self.incremental_limit
+        ):
+            return
+
+        cache = LINE_CACHE.get(self.view.id())
+        if cache is not None and cache.key == self.cache_key:
+            changes, change_count = cache.changes
+            # Edits that were not recorded leave the cache out of date
+            if change_count == self.change_count:
+                self.line_cache = cache
+                self.cache_changes = changes
+        self.cache_size = 0
+        self.new_lines = {}
+        self.line_signatures = {}
+        # The renderer keeps the rendered code of each line (without the line template) by line number,
+        # and counts the characters kept in `codes_size`
+        self.renderer.codes = {}
+
+    def stop_line_cache(self):
+        """Stop collecting the lines rendered by this export, as they take more than the limit."""
+
+        self.line_cache = None
+        self.new_lines = None
+        self.line_signatures = None
+        self.renderer.codes = None
+        LINE_CACHE.pop(self.view.id())
+
+    def store_line_cache(self):
+        """Keep the lines rendered by this export for the next export of the view."""
+
+        # Edits made since the export last checked the view were not recorded
+        if self.view.change_count() != self.change_count:
+            LINE_CACHE.pop(self.view.id())
+            return
+        lines = self.new_lines
+        codes = self.renderer.codes
+        for row, signature in self.line_signatures.items():
+            code = codes.get(row + 1)
+            if code is not None:
+                lines[row] = (signature, code)
+        LINE_CACHE.limit = self.incremental_limit
+        LINE_CACHE.put(self.view.id(), LineCache(self.cache_key, lines, self.change_count))
+
     def convert_view_to_html(self, html):
         """Begin conversion of the view to HTML."""
 
-        for line in self.view.split_by_newlines(sublime.Region(self.pt, self.size)):
-            self.size = line.end()
-            self.line_start = line.begin()
-            self.char_count = 0
-            if self.curr_row > 1:
-                self.line_start -= 1
-            empty = not bool(line.size())
-            line = self.convert_line_to_html(empty)
-            html.write(self.print_line(line, self.curr_row))
+        if self.native:
+            self.convert_view_natively(html)
+            return
+
+        chunked = self.get_chunked_renderer(html)
+        # Views that appear to only have one scope are converted in batches of lines
+        # (selection highlights and annotations add styling of their own, so they are not batched).
+        # Once the export is past its budget, the rest of the lines are converted as plain text in batches.
+        # Long lines are never batched, so they are still written out a slice at a time.
+        uniform = self.uniform_scope is not None and not len(self.highlights) and not len(self.annotations)
+        batch = []
+        batch_lines = self.get_batch_lines()
+        for begin, end in self.buffer.iter_lines(self.pt, self.size):
+            if (self.tier == BUDGET_PLAIN or uniform) and not (
+                self.long_line_threshold and end - begin > self.long_line_threshold
+            ):
+                batch.append((begin, end))
+                if len(batch) < batch_lines:
+                    continue
+                self.convert_uniform_lines(html, batch, chunked)
+                batch = []
+            else:
+                if batch:
+                    self.convert_uniform_lines(html, batch, chunked)
+                    batch = []
+                    if self.budget and self.check_budget(html, chunked):
+                        uniform = self.uniform_scope is not None
+                self.convert_line(html, begin, end, chunked)
+            if self.budget and self.check_budget(html, chunked):
+                uniform = self.uniform_scope is not None
+            batch_lines = self.get_batch_lines()
+
+        if batch:
+            self.convert_uniform_lines(html, batch, chunked)
+            if self.budget:
+                self.check_budget(html, chunked)
+        chunked.flush()
+
+    def flush_before_direct_write(self, chunked):
+        """Write out the lines captured so far, so output written directly to the file goes after them."""
+
+        chunked.flush()
+
+    def get_batch_lines(self):
+        """Get the number of lines of the next batch, which ends where a line budget moves to the next tier."""
+
+        limit = self.budget.get('lines')
+        if limit is None or self.tier == BUDGET_PLAIN:
+            return UNIFORM_BATCH_LINES
+        if self.tier == BUDGET_REDUCED:
+            limit *= BUDGET_PLAIN_FACTOR
+        return max(min(UNIFORM_BATCH_LINES, int(math.ceil(limit - self.stats["lines"]))), 1)
+
+    def convert_view_natively(self, html):
+        """Convert the view to HTML a block of lines at a time with the native HTML export of the view."""
+
+        renderer = self.renderer
+        renderer.start_line(self.bground)
+        empty_line = renderer.format_text('', self.fground, self.bground, '', True)
+        block = []
+        for line in self.buffer.iter_lines(self.pt, self.size):
+            block.append(line)
+            if len(block) >= NATIVE_BLOCK_LINES:
+                self.convert_block_natively(html, block, empty_line)
+                block = []
+        if block:
+            self.convert_block_natively(html, block, empty_line)
+
+    def export_natively(self, begin, end):
+        """Get the styled text of the region from the native HTML export of the view."""
+
+        code = self.view.export_to_html(
+            sublime.Region(begin, end), enclosing_tags=False, font_size=False, font_family=False
+        )
+        if self.disable_nbsp:
+            code = code.replace('&nbsp;', ' ')
+        return code
+
+    def convert_block_natively(self, html, block, empty_line):
+        """Convert a block of lines with one native HTML export."""
+
+        codes = split_lines(self.export_natively(block[0][0], block[-1][1]))
+        if len(codes) != len(block):
+            # The export doesn't break up into the lines of the block, so export each line on its own
+            codes = [self.export_natively(begin, end) if begin != end else '' for begin, end in block]
+
+        renderer = self.renderer
+        for (begin, end), code in zip(block, codes):
+            html.write(renderer.format_line(code if begin != end else empty_line, None, self.curr_row))
             self.curr_row += 1
+        self.pt = block[-1][1]
+        self.stats["lines"] += len(block)
+        self.check_progress()
+
+    def convert_line(self, html, begin, end, chunked):
+        """Convert a line to HTML."""
+
+        view_size = self.buffer.size()
+        self.size = end
+        self.line_start = begin
+        if self.curr_row > 1:
+            self.line_start -= 1
+        empty = begin == end
+        long_line = self.long_line_threshold and end - begin > self.long_line_threshold
+        # Capture the scope runs of the line (including the trailing newline for the end of line color).
+        # Long lines get their runs a window at a time.
+        # Past the budget, lines are plain text, so their scopes are not needed.
+        self.runs_end = min(self.size + 1, view_size)
+        if self.tier == BUDGET_PLAIN:
+            self.line_runs = []
+        else:
+            self.line_runs = get_scope_runs(
+                self.view, self.pt, min(self.pt + LONG_LINE_SLICE, self.runs_end) if long_line else self.runs_end,
+                self.scope_engine, self.scopes
+            )
+        self.run_idx = 0
+        if long_line:
+            self.flush_before_direct_write(chunked)
+            self.convert_long_line_to_html(html, empty)
+        else:
+            self.start_line_capture()
+            if self.new_lines is None or not self.reuse_line(html, chunked):
+                self.convert_line_to_html(chunked.doc, empty)
+                chunked.check()
+        self.curr_row += 1
+        self.stats["lines"] += 1
+        if self.stats["lines"] % PROGRESS_LINES == 0:
+            self.check_progress()
+
+    def reuse_line(self, html, chunked):
+        """Write the line as the last export rendered it if it has not changed, returning `True` if it did."""
+
+        if self.cache_size + self.renderer.codes_size > self.incremental_limit:
+            self.stop_line_cache()
+            return False
+
+        signature = get_signature(self.line_runs, self.pt, self.guess_style, self.ebground)
+        row = self.curr_row - 1
+        cached = None
+        if self.line_cache is not None:
+            cached = self.line_cache.get_line(row, self.cache_changes, signature)
+
+        if cached is None:
+            # Keep the signature until the line is rendered
+            self.line_signatures[row] = signature
+            self.cache_size += LINE_OVERHEAD
+            return False
+
+        self.flush_before_direct_write(chunked)
+        html.write(self.renderer.format_line(cached[1], self.ebground, self.curr_row))
+        self.new_lines[row] = cached
+        self.cache_size += len(cached[1]) + LINE_OVERHEAD
+        self.pt = self.size
+        self.end = self.pt + 1
+        self.stats["reused_lines"] += 1
+        return True
+
+    def convert_uniform_lines(self, html, lines, chunked):
+        """Convert lines that are expected to share a single scope, checking the scopes of all of them at once."""
+
+        first_begin, first_end = lines[0]
+        last_end = lines[-1][1]
+        if self.tier == BUDGET_PLAIN:
+            color, bgcolor, style = self.fground, self.bground, ''
+            self.ebground = self.bground
+        else:
+            scope = single_scope(self.view, self.pt, min(last_end + 1, self.buffer.size()), self.scope_engine)
+            if scope is None:
+                for begin, end in lines:
+                    self.convert_line(html, begin, end, chunked)
+                return
+            color_match = self.guess_style(self.scopes.get_id(scope))
+            color, bgcolor, style = color_match.fg_simulated, color_match.bg_simulated, color_match.style
+            if first_end + 1 < self.buffer.size():
+                self.ebground = bgcolor
+
+        self.flush_before_direct_write(chunked)
+
+        self.line_bground = (self.ebground or self.bground) if self.table_mode else self.bground
+        html.write(
+            self.renderer.render_plain_lines(
+                self.buffer.substr(first_begin, last_end),
+                self.pt != first_begin or self.curr_row == 1,
+                self.pt != first_begin,
+                color, bgcolor, style, self.line_bground, self.ebground, self.curr_row
+            )
+        )
 
-    def html_encode(self, text, start_pt=None):
-        """Format text to HTML."""
+        self.size = self.pt = last_end
+        self.end = self.pt + 1
+        self.curr_row += len(lines)
+        self.stats["lines"] += len(lines)
+        self.check_progress()
 
-        new_text = []
-        for c in text:
-            if c == '\t' and not self.disable_nbsp:
-                tab_size = self.tab_size - self.char_count % self.tab_size
-                new_text.append(' ' * tab_size)
-                self.char_count += tab_size
-            elif c == '&':
-                new_text.append('&amp;')
-                self.char_count += 1
-            elif c == '>':
-                new_text.append('&gt;')
-                self.char_count += 1
-            elif c == '<':
-                new_text.append('&lt;')
-                self.char_count += 1
-            elif c != '\n':
-                new_text.append(c)
-                self.char_count += 1
+    def check_budget(self, html, chunked):
+        """Move the export to a lower tier past its budget (`export_budget`), returning `True` if it did."""
 
-        if self.disable_nbsp:
-            return ''.join(new_text).encode('ascii', 'xmlcharrefreplace').decode("utf-8")
+        used = {
+            "bytes": self.budget_output.written if self.budget_output is not None else 0,
+            "lines": self.stats["lines"],
+            "seconds": time.time() - self.start_time
+        }
+        ratio = max(used[key] / limit for key, limit in self.budget.items())
+        if ratio >= BUDGET_PLAIN_FACTOR:
+            tier = BUDGET_PLAIN
+        elif ratio >= 1:
+            tier = BUDGET_REDUCED
         else:
-            return re.sub(
-                r'(?<=^) | (?= )' if start_pt is not None and start_pt == self.line_start else r' (?= )',
-                lambda m: '&nbsp;' * len(m.group(0)),
-                ''.join(new_text).encode('ascii', 'xmlcharrefreplace').decode("utf-8")
+            tier = BUDGET_FULL
+        if tier <= self.tier:
+            return False
+
+        self.flush_before_direct_write(chunked)
+        self.tier = tier
+        self.stats["tier"] = BUDGET_TIERS[tier]
+        html.write(BUDGET_MARKER % {"line": self.curr_row, "tier": self.stats["tier"]})
+        print('ExportHtml: Export budget exceeded at line %d, continuing with tier "%s"' % (
+            self.curr_row, self.stats["tier"]
+        ))
+
+        # Drop highlight and annotation detail for the rest of the export
+        self.highlights = IntervalIndex()
+        self.curr_hl = None
+        self.hl_continue = None
+        self.annotations = IntervalIndex()
+        self.curr_annot = None
+        self.curr_comment = None
+        return True
+
+    def scope_run(self):
+        """Get the ID of the scope at the current point and where its run ends on the current line."""
+
+        runs = self.line_runs
+        while runs[self.run_idx][1] <= self.pt:
+            self.run_idx += 1
+        run = runs[self.run_idx]
+        while self.run_idx == len(runs) - 1 and run[1] < self.runs_end:
+            # Long lines get their runs a window at a time, and the run may carry on in the next window
+            more = get_scope_runs(
+                self.view, run[1], min(run[1] + LONG_LINE_SLICE, self.runs_end), self.scope_engine, self.scopes
             )
+            if more[0][2] == run[2]:
+                run = (run[0], more[0][1], run[2])
+                more = more[1:]
+            runs = self.line_runs = [run] + more
+            self.run_idx = 0
+        return run[2], min(run[1], self.size)
+
+    def html_encode(self, text, start_pt=None):
+        """Format text to HTML."""
+
+        text, self.char_count = self.encoder.encode(
+            text, self.char_count, start_pt is not None and start_pt == self.line_start
+        )
+        return text
 
     def get_annotations(self):
         """Get annotation."""
@@ -724,12 +1386,12 @@ class ExportHtml(object):
         annotations = get_annotations(self.view)
         comments = []
         for x in range(0, int(annotations["count"])):
-            region = annotations["annotations"]["html_annotation_%d" % x]["region"]
-            comments.append((region, annotations["annotations"]["html_annotation_%d" % x]["comment"]))
-        comments.sort()
-        return comments
+            annotation = annotations["annotations"]["html_annotation_%d" % x]
+            region = annotation["region"]
+            comments.append((int(region[0]), int(region[1]), annotation["comment"]))
+        return IntervalIndex(comments)
 
-    def annotate_text(self, line, color, bgcolour, style, empty):
+    def annotate_text(self, doc, style_id):
         """Handle annotation text."""
 
         pre_text = None
@@ -737,45 +1399,75 @@ class ExportHtml(object):
         post_text = None
         start = None
 
+        annot_begin, annot_end = self.curr_annot
+
         # Pretext Check
-        if self.pt >= self.curr_annot.begin():
+        if self.pt >= annot_begin:
             # Region starts with an annotation
             start = self.pt
         else:
             # Region has text before annoation
-            pre_text = self.html_encode(self.view.substr(sublime.Region(self.pt, self.curr_annot.begin())), self.pt)
-            start = self.curr_annot.begin()
+            pre_text = self.buffer.substr(self.pt, annot_begin)
+            start = annot_begin
 
-        if self.end == self.curr_annot.end():
+        if self.end == annot_end:
             # Region ends annotation
-            annot_text = self.html_encode(self.view.substr(sublime.Region(start, self.end)), start)
+            annot_text = self.buffer.substr(start, self.end)
             self.curr_annot = None
-        elif self.end > self.curr_annot.end():
+        elif self.end > annot_end:
             # Region has text following annotation
-            annot_text = self.html_encode(self.view.substr(sublime.Region(start, self.curr_annot.end())), start)
-            post_text = self.html_encode(
-                self.view.substr(sublime.Region(self.curr_annot.end(), self.end)), self.curr_annot.end()
-            )
+            annot_text = self.buffer.substr(start, annot_end)
+            post_text = self.buffer.substr(annot_end, self.end)
             self.curr_annot = None
         else:
             # Region ends but annotation is not finished
-            annot_text = self.html_encode(self.view.substr(sublime.Region(start, self.end)), start)
-            self.curr_annot = sublime.Region(self.end, self.curr_annot.end())
+            annot_text = self.buffer.substr(start, self.end)
+            self.curr_annot = (self.end, annot_end)
 
-        # Print the separate parts pre text, annotation, post text
+        # Capture the separate parts pre text, annotation, post text
         if pre_text is not None:
-            self.format_text(line, pre_text, color, bgcolour, style, empty)
+            doc.add_run(pre_text, self.pt == self.line_start, style_id)
         if annot_text is not None:
-            self.format_text(line, annot_text, color, bgcolour, style, empty, annotate=True)
+            doc.add_run(annot_text, start == self.line_start, style_id, self.get_annotation_marker())
             if self.curr_annot is None:
                 self.curr_comment = None
         if post_text is not None:
-            self.format_text(line, post_text, color, bgcolour, style, empty)
+            doc.add_run(post_text, annot_end == self.line_start, style_id)
+
+    def get_annotation_marker(self):
+        """Get whether annotated text opens or closes its annotation, and track the annotation state."""
+
+        comment = None
+        close = False
+        if self.curr_annot is not None and not self.open_annot:
+            # Open an annotation
+            if self.annot_pt is not None:
+                self.add_annotation_table_entry()
+            if self.new_annot:
+                self.annot_num += 1
+                self.new_annot = False
+            comment = str(self.annot_num)
+            self.open_annot = True
+        elif self.curr_annot is None:
+            if self.open_annot:
+                # Close an annotation
+                close = True
+                self.open_annot = False
+            else:
+                # Do a complete annotation
+                if self.annot_pt is not None:
+                    self.add_annotation_table_entry()
+                if self.new_annot:
+                    self.annot_num += 1
+                    self.new_annot = False
+                comment = str(self.annot_num)
+                close = True
+        return comment, close
 
     def add_annotation_table_entry(self):
         """Add entry to the annotation table."""
 
-        row, col = self.view.rowcol(self.annot_pt)
+        row, col = self.buffer.rowcol(self.annot_pt)
         self.annot_tbl.append(
             (
                 self.tables, self.curr_row, "Line %d Col %d" % (row + 1, col + 1),
@@ -784,137 +1476,144 @@ class ExportHtml(object):
         )
         self.annot_pt = None
 
-    def format_text(self, line, text, color, bgcolor, style, empty, annotate=False):
-        """Format the text."""
+    def start_line_capture(self):
+        """Get the colors of the line and continue any highlight from the last line."""
 
-        if not style:
-            style = 'normal'
+        # Get the color for the space at the end of a line
+        # (the scope of the trailing newline is the last run of the line,
+        # unless the runs of a long line are still being fetched)
+        if self.tier == BUDGET_PLAIN:
+            self.ebground = self.bground
+        elif self.size + 1 < self.buffer.size():
+            if self.line_runs[-1][1] == self.runs_end:
+                end_id = self.line_runs[-1][2]
+            else:
+                end_id = self.scopes.get_id(self.view.scope_name(self.size))
+            color_match = self.guess_style(end_id)
+            self.ebground = color_match.bg_simulated
 
-        if empty and not self.disable_nbsp:
-            text = '&nbsp;'
-            style += " empty_text"
-        else:
-            style += " real_text"
+        # Background the code is rendered on
+        self.line_bground = (self.ebground or self.bground) if self.table_mode else self.bground
 
-        if bgcolor is None:
-            bgcolor = self.bground
+        # Continue highlight form last line
+        if self.hl_continue is not None:
+            self.curr_hl = self.hl_continue
+            self.hl_continue = None
 
-        if annotate:
-            code = ANNOTATION_CODE % {"highlight": bgcolor, "color": color, "content": text, "class": style}
-        else:
-            code = CODE % {"highlight": bgcolor, "color": color, "content": text, "class": style}
+    def finish_line_capture(self):
+        """Check if the line closes an annotation that is still open."""
 
-        if annotate:
-            if self.curr_annot is not None and not self.open_annot:
-                # Open an annotation
-                if self.annot_pt is not None:
-                    self.add_annotation_table_entry()
-                if self.new_annot:
-                    self.annot_num += 1
-                    self.new_annot = False
-                code = ANNOTATE_OPEN % {"code": code, "comment": str(self.annot_num)}
-                self.open_annot = True
-            elif self.curr_annot is None:
-                if self.open_annot:
-                    # Close an annotation
-                    code += ANNOTATE_CLOSE
-                    self.open_annot = False
-                else:
-                    # Do a complete annotation
-                    if self.annot_pt is not None:
-                        self.add_annotation_table_entry()
-                    if self.new_annot:
-                        self.annot_num += 1
-                        self.new_annot = False
-                    code = (
-                        ANNOTATE_OPEN % {"code": code, "comment": str(self.annot_num)} +
-                        ANNOTATE_CLOSE
-                    )
-        line.append(code)
+        if self.open_annot:
+            self.open_annot = False
+            return True
+        return False
 
-    def convert_line_to_html(self, empty):
-        """Convert the line to its HTML representation."""
+    def convert_line_to_html(self, doc, empty):
+        """Capture the text and resolved styles of the line into the document for the renderer."""
 
-        line = []
-        hl_done = False
+        self.capture_runs(doc, empty)
+        doc.end_line(
+            self.finish_line_capture(), empty,
+            self.styles.get_color(self.line_bground), self.styles.get_color(self.ebground), self.curr_row
+        )
 
-        # Continue highlight form last line
-        if self.hl_continue is not None:
-            self.curr_hl = self.hl_continue
-            self.hl_continue = None
+    def convert_long_line_to_html(self, html, empty):
+        """Capture and render a long line a slice at a time, writing out each slice as it is rendered."""
+
+        renderer = self.renderer
+        self.start_line_capture()
+        prefix, postfix = renderer.format_line(CONTENT, self.ebground, self.curr_row).split(CONTENT)
+        renderer.start_line(self.line_bground)
+        html.write(prefix)
+        while True:
+            doc = Document()
+            self.capture_runs(doc, empty, self.pt + LONG_LINE_SLICE)
+            code = [renderer.render_runs(doc, self.styles, 0, doc.run_count(), empty)]
+            # Text held back to merge runs (`coalesce_runs`) is written out with its slice,
+            # so a long line of one style is never held whole
+            renderer.flush_text(code, empty)
+            html.write(''.join(code))
+            if self.end > self.size:
+                break
+            if self.long_line_wrap_hints:
+                html.write(WRAP_HINT)
+            self.check_progress()
+        html.write(renderer.finish_line(ANNOTATE_CLOSE if self.finish_line_capture() else '', empty) + postfix)
+
+    def capture_runs(self, doc, empty, stop=None):
+        """Capture the text and resolved styles of the line, stopping at `stop` if given."""
+
+        hl_done = False
+        highlight = False
 
-        while self.end <= self.size:
+        while self.end <= self.size and (stop is None or self.pt < stop):
             # Get next highlight region
-            if self.highlight_selections and self.curr_hl is None and len(self.highlights) > 0:
-                self.curr_hl = self.highlights.pop(0)
-
-            # See if we are starting a highlight region
-            if self.curr_hl is not None and self.pt == self.curr_hl.begin():
-                # Get text of like scope up to a highlight
-                scope_name = self.view.scope_name(self.pt)
-                while self.view.scope_name(self.end) == scope_name and self.end < self.size:
-                    # Kick out if we hit a highlight region
-                    if self.end == self.curr_hl.end():
-                        break
-                    self.end += 1
-                if self.end < self.curr_hl.end():
+            if self.curr_hl is None and self.highlights.remaining():
+                self.curr_hl = self.highlights.seek(self.pt)
+
+            # Get text of like scope and split it at the highlight boundary
+            if self.tier == BUDGET_PLAIN:
+                # Past the budget, the rest of the line is one run of plain text in the default colors
+                scope_id, self.end = None, self.size
+            else:
+                scope_id, self.end = self.scope_run()
+            cut = stop is not None and self.end > stop
+            if cut:
+                self.end = stop
+            highlight = self.curr_hl is not None and self.pt == self.curr_hl[0]
+            if highlight:
+                # Starting a highlight region: stop at the end of the highlight
+                hl_end = self.curr_hl[1]
+                if self.end > hl_end:
+                    self.end = hl_end
+                if self.end < hl_end:
                     if self.end >= self.size:
-                        self.hl_continue = sublime.Region(self.end, self.curr_hl.end())
+                        self.hl_continue = (self.end, hl_end)
                     else:
-                        self.curr_hl = sublime.Region(self.end, self.curr_hl.end())
+                        self.curr_hl = (self.end, hl_end)
                 else:
                     hl_done = True
+            elif self.curr_hl is not None and self.pt < self.curr_hl[0] < self.end:
+                # Stop at the start of the highlight
+                self.end = self.curr_hl[0]
+            # Runs are split at the edges of highlights anyway
+            cut = cut and self.end == stop and not hl_done and not (
+                not highlight and self.curr_hl is not None and self.curr_hl[0] == stop
+            )
 
-                color_match = self.guess_style(
-                    scope_name,
-                    selected=not (hl_done and empty),
-                    no_bold=self.no_bold,
-                    no_italic=self.no_italic
-                )
-                color = color_match.fg_simulated
-                style = color_match.style
-                bgcolor = color_match.bg_simulated
-
+            if self.tier == BUDGET_PLAIN:
+                color_match = SchemeColors(self.fground, self.bground, '')
             else:
-                # Get text of like scope up to a highlight
-                scope_name = self.view.scope_name(self.pt)
-                while self.view.scope_name(self.end) == scope_name and self.end < self.size:
-                    # Kick out if we hit a highlight region
-                    if self.curr_hl is not None and self.end == self.curr_hl.begin():
-                        break
-                    self.end += 1
-                color_match = self.guess_style(
-                    scope_name,
-                    no_bold=self.no_bold,
-                    no_italic=self.no_italic
-                )
-                color = color_match.fg_simulated
-                style = color_match.style
-                bgcolor = color_match.bg_simulated
+                color_match = self.guess_style(scope_id, selected=highlight and not (hl_done and empty))
+            style_id = self.styles.get_style(
+                color_match.fg_simulated, color_match.bg_simulated, color_match.style, highlight
+            )
 
             # Get new annotation
-            if (self.curr_annot is None or self.curr_annot.end() < self.pt) and len(self.annotations):
-                self.curr_annot, self.curr_comment = self.annotations.pop(0)
-                self.annot_pt = self.curr_annot[0]
-                while self.pt > self.curr_annot[1]:
-                    if len(self.annotations):
-                        self.curr_annot, self.curr_comment = self.annotations.pop(0)
-                        self.annot_pt = self.curr_annot[0]
-                    else:
-                        self.curr_annot = None
-                        self.curr_comment = None
-                        break
+            if (self.curr_annot is None or self.curr_annot[1] < self.pt) and self.annotations.remaining():
+                # Skip annotations that end before this point
+                annotation = self.annotations.seek(self.pt)
+                if annotation is not None:
+                    self.curr_annot = annotation[:2]
+                    self.curr_comment = annotation[2]
+                    self.annot_pt = annotation[0]
+                else:
+                    self.curr_annot = None
+                    self.curr_comment = None
+                    self.annot_pt = self.annotations.begins[-1]
                 self.new_annot = True
-                self.curr_annot = sublime.Region(self.curr_annot[0], self.curr_annot[1])
 
-            region = sublime.Region(self.pt, self.end)
-            if self.curr_annot is not None and region.intersects(self.curr_annot):
-                # Apply annotation within the text and format the text
-                self.annotate_text(line, color, bgcolor, style, empty)
+            if self.curr_annot is not None and stop in self.curr_annot:
+                # Runs are split at the edges of annotations anyway
+                cut = False
+            if self.curr_annot is not None and intersects(self.pt, self.end, *self.curr_annot):
+                # Apply annotation within the text
+                self.annotate_text(doc, style_id)
             else:
-                # Normal text formatting
-                tidied_text = self.html_encode(self.view.substr(region), region.begin())
-                self.format_text(line, tidied_text, color, bgcolor, style, empty)
+                # Normal text
+                doc.add_run(self.buffer.substr(self.pt, self.end), self.pt == self.line_start, style_id)
+            if cut and self.buffer.substr(stop, stop + 1) in (' ', '\t'):
+                doc.set_space_next()
 
             if hl_done:
                 # Clear highlight flags and variables
@@ -925,24 +1624,6 @@ class ExportHtml(object):
             self.pt = self.end
             self.end = self.pt + 1
 
-        # Close annotation if open at end of line
-        if self.open_annot:
-            line.append(ANNOTATE_CLOSE % {"comment": self.curr_comment})
-            self.open_annot = False
-
-        # Get the color for the space at the end of a line
-        if self.end < self.view.size():
-            end_key = self.view.scope_name(self.pt)
-            color_match = self.guess_style(
-                end_key,
-                no_bold=self.no_bold,
-                no_italic=self.no_italic
-            )
-            self.ebground = color_match.bg_simulated
-
-        # Join line segments
-        return ''.join(line)
-
     def write_body(self, html):
         """Write the body of the HTML."""
 
@@ -983,10 +1664,16 @@ class ExportHtml(object):
         if self.table_mode:
             html.write(ROW_START)
             html.write(TABLE_START)
+        if 'bytes' in self.budget:
+            # Count the output of the lines against the budget
+            html = self.budget_output = CountingWriter(html)
         # Convert view to HTML
         if self.multi_select:
             count = 0
             total = len(self.sels)
+            self.total_lines = sum(
+                self.buffer.rowcol(sel.end())[0] - self.buffer.rowcol(sel.begin())[0] + 1 for sel in self.sels
+            )
             for sel in self.sels:
                 self.setup_print_block(sel, multi=True)
                 processed_rows += "[" + str(self.curr_row) + ","
@@ -1008,6 +1695,8 @@ class ExportHtml(object):
         else:
             sels = self.view.sel()
             self.setup_print_block(sels[0] if len(sels) else None)
+            self.total_lines = self.buffer.rowcol(self.size)[0] - self.curr_row + 2
+            self.start_line_cache()
             processed_rows += "[" + str(self.curr_row) + ","
             self.convert_view_to_html(html)
             processed_rows += str(self.curr_row) + "],"
@@ -1020,6 +1709,9 @@ class ExportHtml(object):
         else:
             html.write(CODE_END)
 
+        # Make sure the buffer did not change after the last check
+        self.check_progress()
+
         js_options = []
         if len(self.annot_tbl):
             self.add_comments_table(html)
@@ -1070,9 +1762,84 @@ class ExportHtml(object):
         else:
             return tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix=x)
 
+    def write_output(self, html, *writers):
+        """Write the output, handing it off to a writer thread if `pipelined_write` is enabled."""
+
+        if self.pipelined_write:
+            with PipelinedWriter(html) as out:
+                for writer in writers:
+                    writer(out)
+        else:
+            for writer in writers:
+                writer(html)
+
+    def write_html(self, html):
+        """Write the whole HTML document."""
+
+        if self.style_classes:
+            # Style classes are only known once the body is rendered,
+            # so render the body first and write it after the header.
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+') as body:
+                self.write_output(body, self.write_body)
+                self.write_header(html)
+                body.seek(0)
+                shutil.copyfileobj(body, html)
+        else:
+            self.write_output(html, self.write_header, self.write_body)
+
+    def cleanup(self):
+        """Restore the color scheme of the view."""
+
+        if self.switch:
+            self.switch = False
+            if self.save_to_view:
+                self.view.settings().set('color_scheme', self.view_scheme)
+            else:
+                self.view.settings().erase('color_scheme')
+
+    def benchmark(self, **kwargs):
+        """Export the view to a temporary file (without opening it) and get the seconds it took."""
+
+        self.benchmarking = True
+        self.start_time = self.last_report = time.time()
+        try:
+            self.setup(**self.process_inputs(**kwargs))
+            with tempfile.TemporaryFile(mode='w+') as html:
+                self.write_html(html)
+        finally:
+            self.cleanup()
+        return time.time() - self.start_time
+
+    def cancel(self):
+        """Cancel the export."""
+
+        self.cancelled = True
+
+    def check_progress(self):
+        """Stop the export if it was cancelled or the buffer changed, and report progress."""
+
+        if self.cancelled:
+            raise ExportCancelled()
+        if self.view.change_count() != self.change_count:
+            raise ExportChanged()
+
+        if self.report_progress:
+            now = time.time()
+            if now - self.last_report >= PROGRESS_INTERVAL:
+                self.last_report = now
+                lines = self.stats["lines"]
+                elapsed = now - self.start_time
+                rate = lines / elapsed if elapsed > 0 else 0
+                eta = max(self.total_lines - lines, 0) / rate if rate > 0 else 0
+                sublime.status_message(
+                    "ExportHtml: %d/%d lines (%d lines/s, ETA %ds)" % (lines, self.total_lines, rate, eta)
+                )
+
     def run(self, **kwargs):
         """Run command."""
 
+        restart = False
+        self.start_time = self.last_report = time.time()
         try:
             inputs = self.process_inputs(**kwargs)
             self.setup(**inputs)
@@ -1101,26 +1868,61 @@ class ExportHtml(object):
                 html_file = ".html"
 
             with OpenHtml(html_file, save_location) as html:
-                self.write_header(html)
-                self.write_body(html)
+                self.write_html(html)
                 if inputs["clipboard_copy"]:
                     html.seek(0)
                     sublime.set_clipboard(html.read())
                     notify("HTML copied to clipboard")
 
+            if self.new_lines is not None:
+                self.store_line_cache()
+
+            if self.style_cache is not None and len(self.style_memo) > self.cached_styles:
+                self.save_style_cache()
+
             if inputs["view_open"]:
                 self.view.window().open_file(html.name)
             else:
                 # Open in web browser
                 open_in_browser(html.name)
-        except Exception:
-            pass
 
-        if self.switch:
-            if self.save_to_view:
-                self.view.settings().set('color_scheme', self.view_scheme)
-            else:
-                self.view.settings().erase('color_scheme')
+            self.stats["seconds"] = time.time() - self.start_time
+            if self.renderer.memo_lookups:
+                self.stats["memo_hit_rate"] = self.renderer.memo_hits / self.renderer.memo_lookups
+            if self.report_progress:
+                sublime.status_message(
+                    "ExportHtml: exported %d lines in %.1fs (%d%% memo hits, %d reused)%s" % (
+                        self.stats["lines"], self.stats["seconds"], self.stats["memo_hit_rate"] * 100,
+                        self.stats["reused_lines"],
+                        (' (over budget: %s)' % self.stats["tier"]) if self.tier != BUDGET_FULL else ''
+                    )
+                )
+            elif self.tier != BUDGET_FULL:
+                sublime.status_message("ExportHtml: export over budget, finished as %s" % self.stats["tier"])
+        except ExportCancelled:
+            notify("HTML export cancelled")
+        except ExportChanged:
+            restart = self.restarts < MAX_RESTARTS
+            if not restart:
+                error("The buffer kept changing during the export, please try again.")
+        except Exception as e:
+            traceback.print_exc()
+            error("HTML export failed: %s" % e)
+
+        self.cleanup()
+
+        if EXPORTS.get(self.view.id()) is self:
+            del EXPORTS[self.view.id()]
+
+        if restart:
+            # Start over with a fresh exporter against the edited buffer
+            notify("Buffer changed during export, restarting")
+            exporter = ExportHtml(self.view)
+            exporter.restarts = self.restarts + 1
+            exporter.report_progress = self.report_progress
+            if exporter.report_progress:
+                EXPORTS[self.view.id()] = exporter
+            exporter.run(**kwargs)
 
 
 def plugin_loaded():
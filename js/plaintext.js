@@ -5,7 +5,7 @@ function toggle_plain_text() {
       line_len = lines.length,
       text = "",
       plain_pre = document.querySelectorAll("pre.simple_code_page"),
-      orig_pre, pre, i, j, spans, span_len, span;
+      orig_pre, pre, i, line, line_text;
 
   if (plain_pre.length > 0) {
     document.body.removeChild(plain_pre[0]);
@@ -13,25 +13,14 @@ function toggle_plain_text() {
     document.body.className = "code_page code_text";
   } else {
     var re = new RegExp(String.fromCharCode(160), "g");
-    var is_empty = new RegExp("(^|\\s)empty_text(\\s|$)");
+    var trailing_newline = new RegExp("\\n$");
     for (i = 0; i < line_len; i++) {
-      spans = lines[i].querySelectorAll("span.real_text, span.empty_text");
-      span_len = spans.length;
-      for (j = 0; j < span_len; j++) {
-        span = spans[j];
-        if (span.className.search(is_empty) != -1) {
-          if ("textContent" in span) {
-            text += span.textContent.replace(re, '');
-          } else {
-            text += span.innerText.replace(re, '');
-          }
-        } else {
-          if ("textContent" in span) {
-            text += span.textContent.replace(re, ' ');
-          } else {
-            text += span.innerText.replace(re, ' ');
-          }
-        }
+      line = lines[i];
+      // Empty lines only contain a placeholder, and text may not always be wrapped in a span,
+      // so use the text of the whole line unless it is empty.
+      if (line.querySelectorAll("span.empty_text").length === 0) {
+        line_text = ("textContent" in line) ? line.textContent : line.innerText;
+        text += line_text.replace(trailing_newline, '').replace(re, ' ');
       }
       text += "\n";
     }
@@ -0,0 +1,126 @@
+"""Buffer access for the exporter, either live from the view or from an in-memory snapshot."""
+import sublime
+from array import array
+from bisect import bisect_right
+
+# Number of characters of the view split into lines at a time
+LINE_WINDOW = 256 * 1024
+
+
+class ViewBuffer(object):
+    """Answer text and row/column queries directly from the view."""
+
+    def __init__(self, view):
+        """Initialize."""
+
+        self.view = view
+
+    def size(self):
+        """Get the buffer size."""
+
+        return self.view.size()
+
+    def substr(self, begin, end):
+        """Get the text between the two points."""
+
+        return self.view.substr(sublime.Region(begin, end))
+
+    def rowcol(self, pt):
+        """Get the row and column of the point."""
+
+        return self.view.rowcol(pt)
+
+    def split_by_newlines(self, begin, end):
+        """Get the `(begin, end)` of each line between the two points."""
+
+        return [(line.begin(), line.end()) for line in self.view.split_by_newlines(sublime.Region(begin, end))]
+
+    def iter_lines(self, begin, end, window=LINE_WINDOW):
+        """
+        Yield the `(begin, end)` of each line between the two points.
+
+        The view is split a window of characters at a time, so regions are never created for
+        all lines at once. The last line of a window may be cut short, so it is split again
+        as part of the next window. The window grows if a single line does not fit.
+        """
+
+        size = window
+        while True:
+            stop = min(begin + size, end)
+            lines = self.split_by_newlines(begin, stop)
+            if stop == end:
+                for line in lines:
+                    yield line
+                return
+            if len(lines) < 2:
+                size *= 2
+                continue
+            for line in lines[:-1]:
+                yield line
+            begin = lines[-1][0]
+            size = window
+
+
+class BufferSnapshot(object):
+    """
+    Answer text and row/column queries from a snapshot of the buffer.
+
+    The text is captured with a single call and a line offset index is built locally,
+    so the snapshot no longer depends on the live view.
+    """
+
+    def __init__(self, text):
+        """Initialize."""
+
+        self.text = text
+        self.line_starts = array('L', [0])
+        find = text.find
+        append = self.line_starts.append
+        pos = find('\n')
+        while pos != -1:
+            pos += 1
+            append(pos)
+            pos = find('\n', pos)
+
+    @classmethod
+    def from_view(cls, view):
+        """Create a snapshot from the view's buffer."""
+
+        return cls(view.substr(sublime.Region(0, view.size())))
+
+    def size(self):
+        """Get the buffer size."""
+
+        return len(self.text)
+
+    def substr(self, begin, end):
+        """Get the text between the two points."""
+
+        return self.text[begin:end]
+
+    def rowcol(self, pt):
+        """Get the row and column of the point."""
+
+        pt = max(0, min(pt, len(self.text)))
+        row = bisect_right(self.line_starts, pt) - 1
+        return row, pt - self.line_starts[row]
+
+    def split_by_newlines(self, begin, end):
+        """Get the `(begin, end)` of each line between the two points."""
+
+        return list(self.iter_lines(begin, end))
+
+    def iter_lines(self, begin, end):
+        """Yield the `(begin, end)` of each line between the two points."""
+
+        starts = self.line_starts
+        row = bisect_right(starts, begin) - 1
+        last = len(starts) - 1
+        while True:
+            line_end = starts[row + 1] - 1 if row < last else len(self.text)
+            if line_end >= end:
+                yield (begin, end)
+                return
+            yield (begin, line_end)
+            row += 1
+            begin = starts[row]
@@ -0,0 +1,186 @@
+"""
+Compact model of captured lines.
+
+Captured lines are stored in flat arrays instead of a tuple per run. The text of all runs is
+joined into one string, and each run is its end offset into the text, a style ID, and flags.
+Resolved styles and line colors are interned once in a `StyleTable`, so a run only costs a few
+bytes.
+"""
+from array import array
+
+# Run flags
+RUN_LINE_START = 1
+RUN_ANNOTATED = 2
+RUN_CLOSE = 4
+RUN_SPACE_NEXT = 8
+
+# Line flags
+LINE_EMPTY = 1
+LINE_CLOSE = 2
+
+
+class Style(object):
+    """A resolved style."""
+
+    __slots__ = ('color', 'bgcolor', 'style', 'highlight')
+
+    def __init__(self, color, bgcolor, style, highlight=False):
+        """Initialize."""
+
+        self.color = color
+        self.bgcolor = bgcolor
+        self.style = style
+        self.highlight = highlight
+
+    def key(self):
+        """Get the style as a tuple."""
+
+        return (self.color, self.bgcolor, self.style, self.highlight)
+
+
+class StyleTable(object):
+    """
+    Intern resolved styles and colors as small integer IDs.
+
+    Color ID `0` is always `None`.
+    """
+
+    __slots__ = ('styles', 'style_ids', 'colors', 'color_ids')
+
+    def __init__(self):
+        """Initialize."""
+
+        self.styles = []
+        self.style_ids = {}
+        self.colors = [None]
+        self.color_ids = {None: 0}
+
+    def get_style(self, color, bgcolor, style, highlight=False):
+        """Get the ID of the style."""
+
+        key = (color, bgcolor, style, highlight)
+        style_id = self.style_ids.get(key)
+        if style_id is None:
+            style_id = self.style_ids[key] = len(self.styles)
+            self.styles.append(Style(*key))
+        return style_id
+
+    def get_color(self, color):
+        """Get the ID of the color."""
+
+        color_id = self.color_ids.get(color)
+        if color_id is None:
+            color_id = self.color_ids[color] = len(self.colors)
+            self.colors.append(color)
+        return color_id
+
+
+class ScopeTable(object):
+    """
+    Intern scope names as small integer IDs.
+
+    Every scope name has one ID and one string object for the whole export, so runs are compared and
+    resolved styles are cached by ID. Names are only needed to resolve a new scope and to persist styles.
+    """
+
+    __slots__ = ('names', 'ids')
+
+    def __init__(self):
+        """Initialize."""
+
+        self.names = []
+        self.ids = {}
+
+    def get_id(self, scope):
+        """Get the ID of the scope name."""
+
+        scope_id = self.ids.get(scope)
+        if scope_id is None:
+            scope_id = self.ids[scope] = len(self.names)
+            self.names.append(scope)
+        return scope_id
+
+
+class Document(object):
+    """Captured lines, as flat arrays of runs and of lines."""
+
+    __slots__ = (
+        'parts', 'text', 'run_ends', 'run_styles', 'run_flags', 'comments',
+        'line_runs', 'line_flags', 'line_nums', 'line_bgrounds', 'line_ebgrounds'
+    )
+
+    def __init__(self):
+        """Initialize."""
+
+        self.parts = []
+        self.text = ''
+        # Each run is the raw buffer text up to `run_ends[i]` (from the end of the previous run),
+        # the style ID `run_styles[i]`, and `run_flags[i]`: if the run is at the start of a line,
+        # if it is annotated, if it closes its annotation, and if it is cut short of a space or tab
+        # (the slices of long lines). An annotated run that opens its annotation has its comment number
+        # in `comments`.
+        self.run_ends = array('I')
+        self.run_styles = array('I')
+        self.run_flags = array('B')
+        self.comments = {}
+        # The runs of line `i` are `line_runs[i]` up to `line_runs[i + 1]`. Each line also has flags
+        # (if it is empty, and if it closes an annotation that is still open), its line number,
+        # and the color IDs of the background it is rendered on and of its end of line.
+        self.line_runs = array('I', [0])
+        self.line_flags = array('B')
+        self.line_nums = array('I')
+        self.line_bgrounds = array('I')
+        self.line_ebgrounds = array('I')
+
+    def __len__(self):
+        """Get the number of lines."""
+
+        return len(self.line_nums)
+
+    def run_count(self):
+        """Get the number of runs."""
+
+        return len(self.run_ends)
+
+    def get_text(self):
+        """Get the text of all runs."""
+
+        if self.parts:
+            self.text += ''.join(self.parts)
+            self.parts = []
+        return self.text
+
+    def add_run(self, text, line_start, style_id, annotation=None):
+        """
+        Add a run.
+
+        `annotation` is `None` for text outside of annotations, or `(comment, close)` where `comment` is
+        the comment number to open an annotation with (if any) and `close` says if the annotation ends.
+        """
+
+        self.parts.append(text)
+        self.run_ends.append((self.run_ends[-1] if self.run_ends else 0) + len(text))
+        self.run_styles.append(style_id)
+        flags = RUN_LINE_START if line_start else 0
+        if annotation is not None:
+            comment, close = annotation
+            flags |= RUN_ANNOTATED
+            if close:
+                flags |= RUN_CLOSE
+            if comment is not None:
+                self.comments[len(self.run_flags)] = comment
+        self.run_flags.append(flags)
+
+    def set_space_next(self):
+        """Mark the last run as cut short of a space or tab."""
+
+        self.run_flags[-1] |= RUN_SPACE_NEXT
+
+    def end_line(self, close, empty, line_bground, ebground, num):
+        """End the current line, with the color IDs of its background and end of line."""
+
+        self.line_runs.append(len(self.run_ends))
+        self.line_flags.append((LINE_EMPTY if empty else 0) | (LINE_CLOSE if close else 0))
+        self.line_nums.append(num)
+        self.line_bgrounds.append(line_bground)
+        self.line_ebgrounds.append(ebground)
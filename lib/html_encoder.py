@@ -0,0 +1,92 @@
+"""Encode buffer text to HTML."""
+import re
+
+HTML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\n': None})
+HTML_ESCAPE_LINES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+RE_NBSP = re.compile(r' (?= )')
+RE_NBSP_LINE_START = re.compile(r'^ | (?= )')
+RE_NBSP_LINES = re.compile(r'^ | (?= )', re.M)
+
+
+class HtmlEncoder(object):
+    """
+    Encode text to HTML.
+
+    Special characters are escaped through a translation table, tabs are expanded a segment
+    at a time from the known column, and non-ASCII characters are converted to character references.
+    Unless `disable_nbsp` is enabled, consecutive spaces (and a space at the start of a line)
+    are converted to `&nbsp;`.
+    """
+
+    def __init__(self, tab_size=4, disable_nbsp=False):
+        """Initialize."""
+
+        self.tab_size = tab_size
+        self.disable_nbsp = disable_nbsp
+
+    def expand_tabs(self, text, col):
+        """Expand tabs to spaces starting from the given column."""
+
+        tab_size = self.tab_size
+        segments = text.split('\t')
+        last = segments.pop()
+        parts = []
+        for segment in segments:
+            col += len(segment)
+            pad = tab_size - col % tab_size
+            parts.append(segment)
+            parts.append(' ' * pad)
+            col += pad
+        parts.append(last)
+        return ''.join(parts), col + len(last)
+
+    def encode(self, text, col=0, line_start=False, space_next=False):
+        """
+        Encode the text.
+
+        `col` is the column the text starts at (used for tab stops). Newlines are dropped and
+        do not count towards the column. Returns the encoded text and the new column.
+        `space_next` says that the text is cut short of a space or tab that is encoded separately,
+        so a space at the end of the text is encoded as if it was followed by that space.
+        """
+
+        if '\n' in text:
+            text = text.replace('\n', '')
+
+        if not self.disable_nbsp and '\t' in text:
+            text, col = self.expand_tabs(text, col)
+        else:
+            col += len(text)
+
+        text = text.translate(HTML_ESCAPE).encode('ascii', 'xmlcharrefreplace').decode('utf-8')
+
+        if not self.disable_nbsp and ('  ' in text or (line_start and text[:1] == ' ')):
+            text = (RE_NBSP_LINE_START if line_start else RE_NBSP).sub('&nbsp;', text)
+
+        if space_next and not self.disable_nbsp and text[-1:] == ' ':
+            text = text[:-1] + '&nbsp;'
+
+        return text, col
+
+    def encode_lines(self, text):
+        """
+        Encode several lines of text at once.
+
+        Each line is encoded as if it was passed to `encode` on its own, starting at
+        column 0 at the start of a line. Returns the list of encoded lines.
+        """
+
+        if '\r' in text:
+            # `expandtabs` would also reset the column at carriage returns
+            return [self.encode(line, 0, True)[0] for line in text.split('\n')]
+
+        if not self.disable_nbsp and '\t' in text:
+            text = text.expandtabs(self.tab_size)
+
+        text = text.translate(HTML_ESCAPE_LINES).encode('ascii', 'xmlcharrefreplace').decode('utf-8')
+
+        if not self.disable_nbsp:
+            text = RE_NBSP_LINES.sub('&nbsp;', text)
+
+        return text.split('\n')
@@ -0,0 +1,56 @@
+"""Sorted, non-overlapping intervals with a forward cursor."""
+from bisect import bisect_left
+
+
+def intersects(begin1, end1, begin2, end2):
+    """Check if two intervals intersect (same rules as `sublime.Region.intersects`)."""
+
+    return (
+        (begin1 == begin2 and end1 == end2) or
+        begin1 < begin2 < end1 or begin1 < end2 < end1 or
+        begin2 < begin1 < end2 or begin2 < end1 < end2
+    )
+
+
+class IntervalIndex(object):
+    """
+    Sorted, non-overlapping intervals.
+
+    Intervals are given as `(begin, end)` or `(begin, end, value)` tuples and are sorted on creation.
+    As they do not overlap, both the starts and the ends are in ascending order and can be searched with `bisect`.
+
+    `seek` finds the next interval in `O(log n)` and moves a forward only cursor past it, so intervals
+    the export has already walked past are never looked at again.
+    """
+
+    def __init__(self, intervals=()):
+        """Initialize."""
+
+        self.intervals = sorted(intervals)
+        self.begins = [i[0] for i in self.intervals]
+        self.ends = [i[1] for i in self.intervals]
+        self.cursor = 0
+
+    def __len__(self):
+        """Get the number of intervals."""
+
+        return len(self.intervals)
+
+    def remaining(self):
+        """Check if there are intervals past the cursor."""
+
+        return self.cursor < len(self.intervals)
+
+    def seek(self, pt):
+        """
+        Advance the cursor to the first interval that ends at or after the point and consume it.
+
+        Returns the interval, or `None` if all intervals end before the point.
+        """
+
+        idx = bisect_left(self.ends, pt, self.cursor)
+        if idx < len(self.intervals):
+            self.cursor = idx + 1
+            return self.intervals[idx]
+        self.cursor = idx
+        return None
@@ -0,0 +1,122 @@
+"""
+Rendered lines of the last export of a view.
+
+The next export of the view only needs to render the lines that changed. The edits to the view are
+recorded as they happen (see `LineCache.add_change`) as the rows that changed: everything before the first
+changed row is the same text, and everything after the last changed row is the same text shifted by
+the number of rows that were added or removed.
+
+The caches of all views are kept in a `LineCacheStore`, which drops the caches of the least
+recently exported views once they take more than a set number of bytes.
+"""
+from collections import OrderedDict
+
+# Rough number of bytes a cached line takes besides its rendered code (its signature and the objects holding it)
+LINE_OVERHEAD = 128
+
+
+def get_signature(runs, start, resolve, ebground):
+    """
+    Get the signature of a line.
+
+    The signature is where each scope run of the line ends, the resolved style of the run, and the end
+    of line color. Runs are compared by their resolved style rather than their scope name, so lines
+    rendered before a rule of the color scheme changed don't match the same line afterwards.
+    """
+
+    return tuple([(run[1] - start, resolve(run[2])) for run in runs]), ebground
+
+
+class LineCache(object):
+    """Rendered lines of the last export of a view."""
+
+    def __init__(self, key, lines, change_count):
+        """Initialize."""
+
+        # Everything besides the text that the rendered lines depend on
+        self.key = key
+        # `(signature, code)` of each row: the signature of the line (see `get_signature`)
+        # and its rendered code (without the line template)
+        self.lines = lines
+        # The first and last row of the current text that changed and the number of rows that were added
+        # (negative if rows were removed), along with the change count of the view they bring the cache up to.
+        # Rows after the last changed row are at that offset from where they were in the cached text.
+        # If nothing changed, the last row comes before the first.
+        self.changes = (0, -1, 0), change_count
+        self.size = sum([len(code) + LINE_OVERHEAD for _, code in lines.values()])
+
+    def add_change(self, first, last, rows, change_count):
+        """Record an edit that replaced the rows `first` to `last` with `rows` new rows."""
+
+        (first_changed, last_changed, delta), _ = self.changes
+        delta_rows = rows - (last - first)
+        if last_changed < first_changed:
+            first_changed, last_changed = first, first + rows
+        else:
+            if last_changed > last:
+                last_changed += delta_rows
+            elif last_changed >= first:
+                last_changed = first + rows
+            first_changed = min(first_changed, first)
+            last_changed = max(last_changed, first + rows)
+        # Replace the changes in one go, as they are read from the export thread
+        self.changes = (first_changed, last_changed, delta + delta_rows), change_count
+
+    def get_line(self, row, changes, signature):
+        """Get the cached line of a row outside of the changes with the same signature, or `None`."""
+
+        first, last, delta = changes
+        if row < first:
+            line = self.lines.get(row)
+        elif row > last:
+            line = self.lines.get(row - delta)
+        else:
+            return None
+        return line if line is not None and line[0] == signature else None
+
+
+class LineCacheStore(object):
+    """Line caches by view ID, dropping the least recently used past `limit` bytes (roughly) together."""
+
+    def __init__(self, limit=0):
+        """Initialize."""
+
+        self.caches = OrderedDict()
+        self.limit = limit
+        self.size = 0
+
+    def get(self, view_id):
+        """Get the cache of the view, or `None` if there is none."""
+
+        cache = self.caches.get(view_id)
+        if cache is not None:
+            self.caches.move_to_end(view_id)
+        return cache
+
+    def put(self, view_id, cache):
+        """Keep the cache of the view, dropping the least recently used caches past the limit."""
+
+        self.pop(view_id)
+        if cache.size > self.limit:
+            return
+        self.caches[view_id] = cache
+        self.size += cache.size
+        while self.size > self.limit:
+            self.size -= self.caches.popitem(last=False)[1].size
+
+    def pop(self, view_id):
+        """Drop the cache of the view."""
+
+        cache = self.caches.pop(view_id, None)
+        if cache is not None:
+            self.size -= cache.size
+
+    def record_changes(self, buffer, changes):
+        """Record the text changes of a buffer in the caches of its views."""
+
+        for view in buffer.views():
+            cache = self.caches.get(view.id())
+            if cache is not None:
+                change_count = view.change_count()
+                for change in changes:
+                    cache.add_change(change.a.row, change.b.row, change.str.count('\n'), change_count)
@@ -0,0 +1,37 @@
+"""
+Split the native HTML export of a view into lines.
+
+The view exports a whole region of styled text at once, but every line of an export goes in
+its own line template. A span can cover several lines (a block comment for instance), so tags
+that are still open at the end of a line are closed there and opened again on the next line.
+"""
+import re
+
+RE_LINE_PARTS = re.compile(r'<(/?)([a-zA-Z]+)[^>]*>|\n')
+
+
+def split_lines(fragment):
+    """Split the HTML fragment into one fragment per line (at newlines and `<br>` tags)."""
+
+    lines = []
+    line = []
+    stack = []
+    pos = 0
+    for m in RE_LINE_PARTS.finditer(fragment):
+        line.append(fragment[pos:m.start()])
+        pos = m.end()
+        name = m.group(2)
+        if name is None or name.lower() == 'br':
+            line.extend(['</%s>' % tag for tag, _ in reversed(stack)])
+            lines.append(''.join(line))
+            line = [tag for _, tag in stack]
+        elif m.group(1):
+            if stack:
+                stack.pop()
+            line.append(m.group(0))
+        else:
+            stack.append((name, m.group(0)))
+            line.append(m.group(0))
+    line.append(fragment[pos:])
+    lines.append(''.join(line))
+    return lines
@@ -0,0 +1,371 @@
+"""
+Render captured lines to HTML.
+
+The exporter captures lines into a `Document` with their resolved styles, and the renderer
+turns them into HTML. The renderer does not depend on the Sublime Text API.
+"""
+from collections import OrderedDict
+from .document import Document, RUN_LINE_START, RUN_ANNOTATED, RUN_CLOSE, RUN_SPACE_NEXT, LINE_EMPTY, LINE_CLOSE
+from .html_encoder import HtmlEncoder
+
+# Number of lines captured before they are rendered
+CHUNK_LINES = 2000
+
+# Lines with more text than this are not kept in the rendered line memo
+MEMO_MAX_TEXT = 512
+
+ANNOTATE_OPEN = (
+    '<span onclick="toggle_annotations();" class="tooltip_hotspot" onmouseover="tooltip.show(%(comment)s);" '
+    'onmouseout="tooltip.hide();">%(code)s'
+)
+ANNOTATE_CLOSE = '</span>'
+
+# Marks where the content goes in a compiled span
+CONTENT = '\x00'
+
+CODE = '<span class="%(class)s" style="background-color: %(highlight)s; color: %(color)s;">%(content)s</span>'
+ANNOTATION_CODE = (
+    '<span style="background-color: %(highlight)s;"><a href="javascript:void();" class="annotation">'
+    '<span class="%(class)s annotation" style="color: %(color)s;">%(content)s</span></a></span>'
+)
+
+CODE_NO_STYLE = '<span class="%(class)s">%(content)s</span>'
+CODE_BACKGROUND = '<span class="%(class)s" style="background-color: %(highlight)s;">%(content)s</span>'
+CODE_COLOR = '<span class="%(class)s" style="color: %(color)s;">%(content)s</span>'
+
+CODE_CLASS = '<span class="%(class)s %(style_class)s">%(content)s</span>'
+ANNOTATION_CODE_CLASS = (
+    '<span class="%(style_class)s"><a href="javascript:void();" class="annotation">'
+    '<span class="%(class)s annotation">%(content)s</span></a></span>'
+)
+
+
+class LineRenderer(object):
+    """Render captured lines of a `Document` with the `StyleTable` its style and color IDs refer to."""
+
+    def __init__(self, options, style_class=None):
+        """Initialize."""
+
+        self.options = options
+        self.style_class = style_class
+        self.encoder = HtmlEncoder(options["tab_size"], options["disable_nbsp"])
+        self.disable_nbsp = options["disable_nbsp"]
+        self.coalesce_runs = options["coalesce_runs"]
+        self.absorb_whitespace = options["absorb_whitespace"]
+        self.elide_default_style = options["elide_default_style"]
+        self.fground = options["fground"]
+        self.bground = options["bground"]
+        self.table_mode = options["table_mode"]
+        self.line_template = options.get("line_template", '')
+        self.gutter_fill = options.get("gutter_fill", [])
+        self.gutter_end = options.get("gutter_end", '')
+        self.gutter_pad = options.get("gutter_pad", 0)
+        self.line_bground = ''
+        self.col = 0
+        self.span_cache = {}
+        self.pending_text = None
+        self.memo_size = options.get("line_memo_size", 0)
+        # LRU memo of the rendered code of recent lines (`line_memo_size` lines, `0` disables it)
+        self.memo = OrderedDict() if self.memo_size > 0 else None
+        self.memo_hits = 0
+        self.memo_lookups = 0
+        self.codes = None
+        self.codes_size = 0
+
+    def set_line_template(self, line_template, gutter_fill, gutter_end, gutter_pad):
+        """Set the line template and gutter padding of the current print block."""
+
+        self.line_template = line_template
+        self.gutter_fill = gutter_fill
+        self.gutter_end = gutter_end
+        self.gutter_pad = gutter_pad
+
+    def can_absorb(self, key1, key2):
+        """
+        Check if whitespace with one style can be absorbed by a run with the other.
+
+        The foreground of whitespace is never visible, but the background and underlines are.
+        """
+
+        return (
+            key1[1] == key2[1] and key1[3] == key2[3] and
+            ('underline' in key1[2]) == ('underline' in key2[2])
+        )
+
+    def queue_text(self, line, text, color, bgcolor, style, empty, highlight=False):
+        """
+        Queue text to be formatted.
+
+        When coalescing runs, text is held back and merged with following text
+        that resolves to the same style until the style or highlight state changes.
+        When absorbing whitespace, whitespace only text is merged into a neighboring
+        run with the same background.
+        """
+
+        if not self.coalesce_runs and not self.absorb_whitespace:
+            line.append(self.format_text(text, color, bgcolor, style, empty))
+            return
+
+        key = (color, bgcolor, style, highlight)
+        blank = not text.replace('&nbsp;', '').strip(' \t')
+        pending = self.pending_text
+        if pending is not None:
+            if self.coalesce_runs and pending[0] == key:
+                pending[1].append(text)
+                pending[2] = pending[2] and blank
+                return
+            if self.absorb_whitespace and self.can_absorb(pending[0], key):
+                if blank:
+                    # Absorb the whitespace into the pending run
+                    pending[1].append(text)
+                    return
+                elif pending[2]:
+                    # Pending run is whitespace, so it takes on the style of this run
+                    pending[0] = key
+                    pending[1].append(text)
+                    pending[2] = False
+                    return
+        self.flush_text(line, empty)
+        self.pending_text = [key, [text], blank]
+
+    def flush_text(self, line, empty):
+        """Format any text held back by `queue_text`."""
+
+        if self.pending_text is not None:
+            (color, bgcolor, style, _), text, _ = self.pending_text
+            self.pending_text = None
+            line.append(self.format_text(''.join(text), color, bgcolor, style, empty))
+
+    def compile_span(self, color, bgcolor, style, placeholder, annotate, default_bg):
+        """Compile the opening and closing of a span for the resolved style."""
+
+        # Plain text with no font style that is not a placeholder for an empty line
+        bare = not style and not placeholder
+
+        if not style:
+            style = 'normal'
+        style += " empty_text" if placeholder else " real_text"
+
+        default_fg = color == self.fground
+        if self.elide_default_style and not annotate and (default_bg or default_fg):
+            # Leave out styling that matches what the text is already rendered with
+            if default_bg and default_fg:
+                code = CONTENT if bare else CODE_NO_STYLE % {"content": CONTENT, "class": style}
+            elif self.style_class is not None:
+                code = CODE_CLASS % {
+                    "style_class": self.style_class(color, bgcolor), "content": CONTENT, "class": style
+                }
+            elif default_bg:
+                code = CODE_COLOR % {"color": color, "content": CONTENT, "class": style}
+            else:
+                code = CODE_BACKGROUND % {"highlight": bgcolor, "content": CONTENT, "class": style}
+        elif self.style_class is not None:
+            style_class = self.style_class(color, bgcolor, annotate)
+            if annotate:
+                code = ANNOTATION_CODE_CLASS % {"style_class": style_class, "content": CONTENT, "class": style}
+            else:
+                code = CODE_CLASS % {"style_class": style_class, "content": CONTENT, "class": style}
+        elif annotate:
+            code = ANNOTATION_CODE % {"highlight": bgcolor, "color": color, "content": CONTENT, "class": style}
+        else:
+            code = CODE % {"highlight": bgcolor, "color": color, "content": CONTENT, "class": style}
+
+        return tuple(code.split(CONTENT))
+
+    def format_text(self, text, color, bgcolor, style, empty, annotate=False):
+        """Format the text."""
+
+        placeholder = empty and not self.disable_nbsp
+        if placeholder:
+            text = '&nbsp;'
+
+        if bgcolor is None:
+            bgcolor = self.bground
+
+        key = (
+            color, bgcolor, style, placeholder, annotate,
+            self.elide_default_style and bgcolor == self.line_bground
+        )
+        span = self.span_cache.get(key)
+        if span is None:
+            span = self.compile_span(*key)
+            self.span_cache[key] = span
+        return span[0] + text + span[1]
+
+    def start_line(self, line_bground):
+        """Start rendering a line."""
+
+        self.line_bground = line_bground
+        self.col = 0
+
+    def render_runs(self, doc, styles, first, last, empty):
+        """
+        Render runs `first` up to `last` of the document, which are all on the current line.
+
+        Text queued by `queue_text` is held back until more runs are rendered or the line is finished.
+        """
+
+        line = []
+        col = self.col
+        encode = self.encoder.encode
+        text = doc.get_text()
+        run_ends = doc.run_ends
+        run_styles = doc.run_styles
+        run_flags = doc.run_flags
+        records = styles.styles
+        begin = run_ends[first - 1] if first else 0
+        for idx in range(first, last):
+            end = run_ends[idx]
+            flags = run_flags[idx]
+            record = records[run_styles[idx]]
+            code, col = encode(text[begin:end], col, flags & RUN_LINE_START, flags & RUN_SPACE_NEXT)
+            begin = end
+            if not flags & RUN_ANNOTATED:
+                self.queue_text(line, code, record.color, record.bgcolor, record.style, empty, record.highlight)
+                continue
+
+            # Annotated text is never merged with its neighbors
+            self.flush_text(line, empty)
+            code = self.format_text(code, record.color, record.bgcolor, record.style, empty, annotate=True)
+            if idx in doc.comments:
+                code = ANNOTATE_OPEN % {"code": code, "comment": doc.comments[idx]}
+            if flags & RUN_CLOSE:
+                code += ANNOTATE_CLOSE
+            line.append(code)
+        self.col = col
+        return ''.join(line)
+
+    def finish_line(self, suffix, empty):
+        """Finish rendering the current line."""
+
+        line = []
+        self.flush_text(line, empty)
+        line.append(suffix)
+        return ''.join(line)
+
+    def format_line(self, code, ebground, num):
+        """Wrap the rendered code of a line in the line template."""
+
+        num = str(num)
+        gutter = self.gutter_fill[min(len(num), self.gutter_pad)] + num + self.gutter_end
+        if self.table_mode:
+            return self.line_template % (num, gutter, ebground or self.bground, num, code)
+        return self.line_template % (num, gutter, num, code)
+
+    def render_document(self, doc, styles):
+        """Render the captured lines of a document."""
+
+        rendered = []
+        colors = styles.colors
+        line_runs = doc.line_runs
+        memo = self.memo
+        for idx, flags in enumerate(doc.line_flags):
+            first = line_runs[idx]
+            last = line_runs[idx + 1]
+            key = self.get_memo_key(doc, idx, first, last) if memo is not None else None
+            code = None
+            if key is not None:
+                self.memo_lookups += 1
+                code = memo.get(key)
+                if code is not None:
+                    self.memo_hits += 1
+                    memo.move_to_end(key)
+
+            if code is None:
+                empty = bool(flags & LINE_EMPTY)
+                self.start_line(colors[doc.line_bgrounds[idx]])
+                code = (
+                    self.render_runs(doc, styles, first, last, empty) +
+                    self.finish_line(ANNOTATE_CLOSE if flags & LINE_CLOSE else '', empty)
+                )
+                if key is not None:
+                    memo[key] = code
+                    if len(memo) > self.memo_size:
+                        memo.popitem(last=False)
+            if self.codes is not None:
+                self.codes[doc.line_nums[idx]] = code
+                self.codes_size += len(code)
+            rendered.append(self.format_line(code, colors[doc.line_ebgrounds[idx]], doc.line_nums[idx]))
+        return ''.join(rendered)
+
+    def get_memo_key(self, doc, idx, first, last):
+        """Get the key of a line in the rendered line memo, or `None` if the line can't be memoized."""
+
+        # Lines are looked up by their text, the signature of their runs (length, style, and flags),
+        # and their line flags and background. Lines start at column 0, so the tab stops always line up,
+        # and only the line template (line numbers and IDs) is filled in again on a hit.
+        # Lines that open an annotation have a comment number of their own and are never memoized.
+        run_ends = doc.run_ends
+        begin = run_ends[first - 1] if first else 0
+        end = run_ends[last - 1] if last > first else begin
+        if end - begin > MEMO_MAX_TEXT:
+            return None
+        if doc.comments and any(run in doc.comments for run in range(first, last)):
+            return None
+        return (
+            doc.get_text()[begin:end],
+            tuple([run_end - begin for run_end in run_ends[first:last]]),
+            doc.run_styles[first:last].tobytes(),
+            doc.run_flags[first:last].tobytes(),
+            doc.line_flags[idx],
+            doc.line_bgrounds[idx]
+        )
+
+    def render_plain_lines(self, text, line_start, lead, color, bgcolor, style, line_bground, ebground, num):
+        """
+        Render lines that all share one style, encoding their text in bulk.
+
+        `text` is the lines joined by newlines. `line_start` says if the first line starts at the
+        start of a line, and `lead` says if the first line is preceded by the newline of the line
+        before it (if not, an empty first line has no text to render at all).
+        """
+
+        self.start_line(line_bground)
+        first, _, rest = text.partition('\n')
+        encoded = [self.encoder.encode(first, 0, line_start)[0]]
+        if len(first) < len(text):
+            encoded.extend(self.encoder.encode_lines(rest))
+
+        rendered = []
+        for idx, code in enumerate(encoded):
+            if code or lead or idx:
+                code = self.format_text(code, color, bgcolor, style, not code)
+            rendered.append(self.format_line(code, ebground, num + idx))
+        return ''.join(rendered)
+
+
+class ChunkedRenderer(object):
+    """
+    Render captured lines in chunks.
+
+    Lines are captured straight into `doc`, and every `chunk_lines` lines, the chunk is rendered
+    and written, so only one chunk of captured lines is held in memory at a time.
+    """
+
+    def __init__(self, renderer, styles, write, chunk_lines=CHUNK_LINES):
+        """Initialize."""
+
+        self.renderer = renderer
+        self.styles = styles
+        self.write = write
+        self.chunk_lines = chunk_lines
+        self.doc = Document()
+
+    def check(self):
+        """Render the current chunk if it is full."""
+
+        if len(self.doc) >= self.chunk_lines:
+            self.submit()
+
+    def submit(self):
+        """Render and write the current chunk."""
+
+        if not len(self.doc):
+            return
+        doc, self.doc = self.doc, Document()
+        self.write(self.renderer.render_document(doc, self.styles))
+
+    def flush(self):
+        """Render and write all captured lines."""
+
+        self.submit()
@@ -0,0 +1,129 @@
+"""Extract runs of text that share an identical scope name."""
+import sublime
+
+ENGINES = ('tokens', 'char')
+
+
+def resolve_engine(view, engine):
+    """
+    Resolve the scope engine to use for the given view.
+
+    `auto` (or any unknown value) will use tokens when the API is available (ST4),
+    and walk the characters otherwise.
+    """
+
+    has_tokens = hasattr(view, 'extract_tokens_with_scopes')
+    if engine not in ENGINES or (engine == 'tokens' and not has_tokens):
+        engine = 'tokens' if has_tokens else 'char'
+    return engine
+
+
+def add_run(runs, begin, end, scope):
+    """Add a run, merging it with the previous run if the scope is identical."""
+
+    if runs and runs[-1][1] == begin and runs[-1][2] == scope:
+        runs[-1] = (runs[-1][0], end, scope)
+    else:
+        runs.append((begin, end, scope))
+
+
+def char_runs(view, begin, end, runs=None):
+    """
+    Walk the scopes one character at a time.
+
+    This is the slowest approach as each character costs a call to the editor,
+    but it is the reference the other engines are compared against.
+    """
+
+    if runs is None:
+        runs = []
+    pt = begin
+    while pt < end:
+        scope = view.scope_name(pt)
+        nxt = pt + 1
+        while nxt < end and view.scope_name(nxt) == scope:
+            nxt += 1
+        add_run(runs, pt, nxt, scope)
+        pt = nxt
+    return runs
+
+
+def token_runs(view, begin, end):
+    """Get the scope runs with a single call to `extract_tokens_with_scopes` (ST4)."""
+
+    runs = []
+    last = begin
+    for region, scope in view.extract_tokens_with_scopes(sublime.Region(begin, end)):
+        a = max(region.begin(), begin)
+        b = min(region.end(), end)
+        if a >= b:
+            continue
+        if a > last:
+            # Gaps should not occur, but if they do, fill them in the slow way.
+            char_runs(view, last, a, runs)
+        add_run(runs, a, b, scope)
+        last = b
+    if last < end:
+        char_runs(view, last, end, runs)
+    return runs
+
+
+def get_scope_runs(view, begin, end, engine='char', scopes=None):
+    """
+    Get a list of `(begin, end, scope)` runs for the given range.
+
+    Each run is the largest span of contiguous characters sharing the same scope name.
+    If a scope table is given (see `ScopeTable`), runs hold the ID of the scope instead of its name.
+    """
+
+    if begin >= end:
+        return []
+    if engine == 'tokens':
+        runs = token_runs(view, begin, end)
+    else:
+        runs = char_runs(view, begin, end)
+    if scopes is not None:
+        get_id = scopes.get_id
+        runs = [(a, b, get_id(scope)) for a, b, scope in runs]
+    return runs
+
+
+def single_scope(view, begin, end, engine='char'):
+    """
+    Get the scope of the range if all of it shares one scope, and `None` otherwise.
+
+    This is quicker than getting the runs of the range, as the tokens are only compared and no runs are built.
+    """
+
+    if begin >= end:
+        return None
+    if engine == 'tokens':
+        tokens = view.extract_tokens_with_scopes(sublime.Region(begin, end))
+        if (
+            not tokens or len({scope for _, scope in tokens}) != 1 or
+            tokens[0][0].begin() > begin or tokens[-1][0].end() < end or
+            sum(region.size() for region, _ in tokens) != tokens[-1][0].end() - tokens[0][0].begin()
+        ):
+            # More than one scope, or gaps that must be walked
+            return None
+        return tokens[0][1]
+    runs = get_scope_runs(view, begin, end, engine)
+    return runs[0][2] if len(runs) == 1 else None
+
+
+def sample_scope(view, begin, end, samples):
+    """
+    Sample scopes evenly across the range.
+
+    Returns the scope if every sample shares it, and `None` otherwise. This is only a hint
+    that the range is likely to have one scope: it is cheap, but can miss small runs.
+    """
+
+    if begin >= end:
+        return None
+    step = max((end - begin) // samples, 1)
+    scope = view.scope_name(begin)
+    for pt in range(begin + step, end, step):
+        if view.scope_name(pt) != scope:
+            return None
+    return scope if view.scope_name(end - 1) == scope else None
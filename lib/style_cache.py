@@ -0,0 +1,85 @@
+"""
+Persistent cache of resolved styles.
+
+Every export resolves the style of each scope it comes across, and exports of the same syntax with the same
+color scheme keep resolving the same scopes. The resolved styles are kept on disk, one file per key, so later
+exports start with them. The key holds everything the styles depend on (the color scheme and its overrides,
+the color filter, the syntax, ...), so a change to any of them simply looks up a different file. Only the
+most recently used files are kept.
+"""
+import hashlib
+import json
+import os
+
+EXTENSION = '.json'
+
+
+def dump_key(key):
+    """Get the key as it is stored."""
+
+    return json.dumps(key, sort_keys=True)
+
+
+class StyleCache(object):
+    """Resolved styles on disk, by key, with at most `size` keys kept (least recently used are removed first)."""
+
+    def __init__(self, directory, size):
+        """Initialize."""
+
+        self.directory = directory
+        self.size = size
+
+    def get_path(self, key):
+        """Get the file of the key."""
+
+        return os.path.join(
+            self.directory, hashlib.sha1(dump_key(key).encode('utf-8')).hexdigest() + EXTENSION
+        )
+
+    def load(self, key):
+        """Get the styles of the key, or an empty dictionary if there are none."""
+
+        file_name = self.get_path(key)
+        key = dump_key(key)
+        try:
+            with open(file_name, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('key') != key:
+                return {}
+            # Mark the file as recently used
+            os.utime(file_name, None)
+        except (OSError, ValueError):
+            return {}
+        return data.get('styles', {})
+
+    def save(self, key, styles):
+        """Save the styles of the key, and remove the least recently used keys past the size limit."""
+
+        file_name = self.get_path(key)
+        key = dump_key(key)
+        temp_name = '%s.%d.tmp' % (file_name, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_name, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'styles': styles}, f)
+            os.replace(temp_name, file_name)
+            self.prune()
+        except OSError:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+    def prune(self):
+        """Remove the least recently used keys past the size limit."""
+
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(EXTENSION):
+                file_name = os.path.join(self.directory, name)
+                files.append((os.path.getmtime(file_name), file_name))
+        files.sort(reverse=True)
+        for _, file_name in files[self.size:]:
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
@@ -0,0 +1,116 @@
+"""Write output on a separate thread so rendering can overlap with file I/O."""
+import threading
+import queue
+
+BATCH_SIZE = 64 * 1024
+QUEUE_SIZE = 16
+
+
+class PipelinedWriter(object):
+    """
+    File like object that hands batches of text to a writer thread.
+
+    Writes are collected until a batch reaches `batch_size` characters, and the batch
+    is then pushed onto a bounded queue. The writer thread pulls batches off the queue and
+    writes them to the underlying file. As the queue is bounded, the producer blocks if
+    it gets too far ahead, so at most `queue_size` batches are ever held in memory.
+
+    If the writer thread fails, the remaining output is discarded and the error is raised
+    (once) on the next `write` or on `close`.
+    """
+
+    def __init__(self, file, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        """Initialize."""
+
+        self.file = file
+        self.batch_size = batch_size
+        self.batch = []
+        self.batch_len = 0
+        self.error = None
+        self.raised = False
+        self.closed = False
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.consume)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        """Enter context."""
+
+        return self
+
+    def __exit__(self, type, value, traceback):  # noqa: A002
+        """Flush remaining output and stop the writer thread."""
+
+        if type is None:
+            self.close()
+        else:
+            # Don't hide the error that is already being raised behind one from the writer thread
+            self.stop()
+
+    def consume(self):
+        """Write batches until the end of the stream is reached."""
+
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            if self.error is None:
+                try:
+                    self.file.write(batch)
+                except Exception as e:
+                    # Keep draining the queue so the producer never blocks on a dead writer.
+                    self.error = e
+
+    def check(self):
+        """Raise the writer thread's error, if there was one."""
+
+        if self.error is not None and not self.raised:
+            self.raised = True
+            raise self.error
+
+    def write(self, text):
+        """Queue text to be written."""
+
+        self.batch.append(text)
+        self.batch_len += len(text)
+        if self.batch_len >= self.batch_size:
+            self.check()
+            self.queue.put(''.join(self.batch))
+            self.batch = []
+            self.batch_len = 0
+
+    def stop(self):
+        """Flush the pending batch, wait for all output to be written, and stop the thread."""
+
+        if self.closed:
+            return
+        self.closed = True
+        if self.batch:
+            self.queue.put(''.join(self.batch))
+            self.batch = []
+            self.batch_len = 0
+        self.queue.put(None)
+        self.thread.join()
+
+    def close(self):
+        """Stop the thread and raise the writer thread's error, if there was one."""
+
+        self.stop()
+        self.check()
+
+
+class CountingWriter(object):
+    """File like object that counts the bytes (UTF-8) written through it."""
+
+    def __init__(self, file):
+        """Initialize."""
+
+        self.file = file
+        self.written = 0
+
+    def write(self, text):
+        """Write text."""
+
+        self.written += len(text.encode('utf-8'))
+        self.file.write(text)
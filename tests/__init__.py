@@ -1 +1,35 @@
 """Unit Tests."""
+import sys
+import types
+
+if 'sublime' not in sys.modules:
+    # The modules under test only need regions from the API
+    sublime = types.ModuleType('sublime')
+
+    class Region(object):
+        """Region."""
+
+        def __init__(self, a, b):
+            """Initialize."""
+
+            self.a = a
+            self.b = b
+
+        def begin(self):
+            """Get the beginning."""
+
+            return self.a
+
+        def end(self):
+            """Get the end."""
+
+            return self.b
+
+        def size(self):
+            """Get the size."""
+
+            return self.b - self.a
+
+    sublime.Region = Region
+    sys.modules['sublime'] = sublime
+sublime = sys.modules['sublime']
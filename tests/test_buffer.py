@@ -0,0 +1,105 @@
+"""Test buffer access."""
+import unittest
+from . import sublime
+from lib.buffer import BufferSnapshot, ViewBuffer
+
+TEXTS = ['', '\n', 'a', 'abc\n\nde\r\nf\n', '\n\nxyz\n' + 'long line ' * 5 + '\n\r\n\n', 'a\nb\nc']
+
+
+class View(object):
+    """View with text."""
+
+    def __init__(self, text):
+        """Initialize."""
+
+        self.text = text
+        self.calls = 0
+
+    def size(self):
+        """Get the size."""
+
+        return len(self.text)
+
+    def substr(self, region):
+        """Get the text of the region."""
+
+        return self.text[region.begin():region.end()]
+
+    def split_by_newlines(self, region):
+        """Split the region into lines."""
+
+        self.calls += 1
+        begin = region.begin()
+        lines = []
+        for line in self.text[begin:region.end()].split('\n'):
+            lines.append(sublime.Region(begin, begin + len(line)))
+            begin += len(line) + 1
+        return lines
+
+
+class TestBuffer(unittest.TestCase):
+    """Test buffer access."""
+
+    def test_snapshot(self):
+        """Test text and row/column queries of the snapshot."""
+
+        buffer = BufferSnapshot.from_view(View('ab\r\n\ncd'))
+        self.assertEqual(buffer.size(), 7)
+        self.assertEqual(buffer.substr(1, 6), 'b\r\n\nc')
+        self.assertEqual(buffer.substr(5, 10), 'cd')
+        # Carriage returns are part of the line
+        self.assertEqual(
+            [buffer.rowcol(pt) for pt in range(8)], [(0, 0), (0, 1), (0, 2), (0, 3), (1, 0), (2, 0), (2, 1), (2, 2)]
+        )
+        # Points past the ends are clamped
+        self.assertEqual(buffer.rowcol(-1), (0, 0))
+        self.assertEqual(buffer.rowcol(100), (2, 2))
+
+    def test_snapshot_lines(self):
+        """Test the lines of the snapshot, from and to any point."""
+
+        for text in TEXTS:
+            buffer = BufferSnapshot(text)
+            for begin in range(len(text) + 1):
+                for end in range(begin, len(text) + 1):
+                    self.assertEqual(
+                        list(buffer.iter_lines(begin, end)),
+                        [(r.begin(), r.end()) for r in View(text).split_by_newlines(sublime.Region(begin, end))]
+                    )
+        self.assertEqual(list(BufferSnapshot('a\n\nbc\n').iter_lines(0, 6)), [(0, 1), (2, 2), (3, 5), (6, 6)])
+
+    def test_view_lines(self):
+        """Test that lines straddling the windows of the view are only yielded once, and whole."""
+
+        for text in TEXTS:
+            expected = list(BufferSnapshot(text).iter_lines(0, len(text)))
+            for window in range(1, len(text) + 2):
+                buffer = ViewBuffer(View(text))
+                self.assertEqual(list(buffer.iter_lines(0, len(text), window)), expected)
+            # Starting inside a line
+            begin = min(1, len(text))
+            buffer = ViewBuffer(View(text))
+            self.assertEqual(
+                list(buffer.iter_lines(begin, len(text), 3)), list(BufferSnapshot(text).iter_lines(begin, len(text)))
+            )
+
+    def test_view_window(self):
+        """Test that the view is split a window at a time, and the window grows for a long line."""
+
+        view = View('ab\n' * 10)
+        self.assertEqual(len(list(ViewBuffer(view).iter_lines(0, 30, 6))), 11)
+        self.assertEqual(view.calls, 5)
+        # The window doubles until the line fits
+        view = View('x' * 20 + '\ny')
+        self.assertEqual(list(ViewBuffer(view).iter_lines(0, 22, 4)), [(0, 20), (21, 22)])
+        self.assertEqual(view.calls, 4)
+
+    def test_view(self):
+        """Test text and row/column queries of the view."""
+
+        view = View('ab\ncd')
+        view.rowcol = lambda pt: (pt // 3, pt % 3)
+        buffer = ViewBuffer(view)
+        self.assertEqual(buffer.size(), 5)
+        self.assertEqual(buffer.substr(1, 4), 'b\nc')
+        self.assertEqual(buffer.rowcol(4), (1, 1))
@@ -0,0 +1,50 @@
+"""Test captured document model."""
+import unittest
+from lib.document import Document, ScopeTable, StyleTable, RUN_LINE_START, RUN_ANNOTATED, RUN_CLOSE, LINE_CLOSE
+
+
+class TestDocument(unittest.TestCase):
+    """Test captured document model."""
+
+    def test_style_table(self):
+        """Test that styles and colors are interned."""
+
+        styles = StyleTable()
+        self.assertEqual(styles.get_style('#000000', '#FFFFFF', ''), 0)
+        self.assertEqual(styles.get_style('#000000', '#FFFFFF', '', True), 1)
+        self.assertEqual(styles.get_style('#000000', '#FFFFFF', ''), 0)
+        self.assertEqual(styles.styles[1].key(), ('#000000', '#FFFFFF', '', True))
+        self.assertEqual(styles.get_color(None), 0)
+        self.assertEqual(styles.get_color('#FFFFFF'), 1)
+        self.assertEqual(styles.colors, [None, '#FFFFFF'])
+
+    def test_runs(self):
+        """Test that runs and lines are stored in the arrays."""
+
+        doc = Document()
+        doc.add_run('ab', True, 0)
+        doc.add_run('cde', False, 1, ('0', False))
+        doc.end_line(True, False, 1, 0, 5)
+        doc.add_run('\n', True, 1, (None, True))
+        doc.end_line(False, True, 1, 0, 6)
+
+        self.assertEqual(len(doc), 2)
+        self.assertEqual(doc.get_text(), 'abcde\n')
+        self.assertEqual(list(doc.run_ends), [2, 5, 6])
+        self.assertEqual(list(doc.run_styles), [0, 1, 1])
+        self.assertEqual(
+            list(doc.run_flags), [RUN_LINE_START, RUN_ANNOTATED, RUN_LINE_START | RUN_ANNOTATED | RUN_CLOSE]
+        )
+        self.assertEqual(doc.comments, {1: '0'})
+        self.assertEqual(list(doc.line_runs), [0, 2, 3])
+        self.assertEqual(doc.line_flags[0], LINE_CLOSE)
+        self.assertEqual(list(doc.line_nums), [5, 6])
+
+    def test_scope_table(self):
+        """Test that scope names are interned."""
+
+        scopes = ScopeTable()
+        self.assertEqual(scopes.get_id('source.python meta.function.python'), 0)
+        self.assertEqual(scopes.get_id('source.python'), 1)
+        self.assertEqual(scopes.get_id('source.python meta.function.python'), 0)
+        self.assertEqual(scopes.names, ['source.python meta.function.python', 'source.python'])
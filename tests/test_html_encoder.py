@@ -0,0 +1,89 @@
+"""Test HTML encoder."""
+import unittest
+import random
+import re
+from lib.html_encoder import HtmlEncoder
+
+
+def reference_encode(text, char_count, tab_size, disable_nbsp, line_start):
+    """Character by character encoding the encoder must match."""
+
+    new_text = []
+    for c in text:
+        if c == '\t' and not disable_nbsp:
+            size = tab_size - char_count % tab_size
+            new_text.append(' ' * size)
+            char_count += size
+        elif c == '&':
+            new_text.append('&amp;')
+            char_count += 1
+        elif c == '>':
+            new_text.append('&gt;')
+            char_count += 1
+        elif c == '<':
+            new_text.append('&lt;')
+            char_count += 1
+        elif c != '\n':
+            new_text.append(c)
+            char_count += 1
+
+    text = ''.join(new_text).encode('ascii', 'xmlcharrefreplace').decode("utf-8")
+    if not disable_nbsp:
+        text = re.sub(
+            r'(?<=^) | (?= )' if line_start else r' (?= )',
+            lambda m: '&nbsp;' * len(m.group(0)),
+            text
+        )
+    return text, char_count
+
+
+class TestHtmlEncoder(unittest.TestCase):
+    """Test HTML encoder."""
+
+    def test_specials(self):
+        """Test escaping of special characters."""
+
+        encoder = HtmlEncoder(4, False)
+        self.assertEqual(encoder.encode('<a & b>'), ('&lt;a &amp; b&gt;', 7))
+        self.assertEqual(encoder.encode('café\n'), ('caf&#233;', 4))
+
+    def test_tabs(self):
+        """Test tab expansion from a column."""
+
+        encoder = HtmlEncoder(4, False)
+        self.assertEqual(encoder.encode('\tx', 0), ('&nbsp;&nbsp;&nbsp; x', 5))
+        self.assertEqual(encoder.encode('\tx', 2), ('&nbsp; x', 5))
+        self.assertEqual(encoder.encode(' x', 0, True), ('&nbsp;x', 2))
+        self.assertEqual(encoder.encode(' x', 0, False), (' x', 2))
+        self.assertEqual(HtmlEncoder(4, True).encode('\tx', 2), ('\tx', 4))
+
+    def test_matches_reference(self):
+        """Test that random text encodes exactly like the reference."""
+
+        rand = random.Random(42)
+        chars = ['a', 'b', ' ', ' ', '\t', '\n', '&', '<', '>', 'é', '\U0001F600', '"']
+        for _ in range(2000):
+            text = ''.join(rand.choice(chars) for _ in range(rand.randint(0, 20)))
+            tab_size = rand.randint(1, 8)
+            disable_nbsp = rand.random() < 0.3
+            line_start = rand.random() < 0.5
+            col = rand.randint(0, 10)
+            self.assertEqual(
+                HtmlEncoder(tab_size, disable_nbsp).encode(text, col, line_start),
+                reference_encode(text, col, tab_size, disable_nbsp, line_start),
+                repr(text)
+            )
+
+    def test_encode_lines(self):
+        """Test that encoding lines at once matches encoding each line."""
+
+        rand = random.Random(7)
+        chars = ['a', ' ', ' ', '\t', '\n', '\n', '&', '<', '\r', '\u00e9']
+        for _ in range(2000):
+            text = ''.join(rand.choice(chars) for _ in range(rand.randint(0, 30)))
+            encoder = HtmlEncoder(rand.randint(1, 8), rand.random() < 0.3)
+            self.assertEqual(
+                encoder.encode_lines(text),
+                [encoder.encode(line, 0, True)[0] for line in text.split('\n')],
+                repr(text)
+            )
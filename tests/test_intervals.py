@@ -0,0 +1,26 @@
+"""Test interval index."""
+import unittest
+from lib.intervals import IntervalIndex, intersects
+
+
+class TestIntervalIndex(unittest.TestCase):
+    """Test interval index."""
+
+    def test_seek(self):
+        """Test that seeking skips intervals ending before the point and only moves forward."""
+
+        index = IntervalIndex([(10, 12, 'b'), (0, 2, 'a'), (20, 30, 'c')])
+        self.assertEqual(index.seek(2), (0, 2, 'a'))
+        self.assertEqual(index.seek(5), (10, 12, 'b'))
+        self.assertEqual(index.seek(0), (20, 30, 'c'))
+        self.assertFalse(index.remaining())
+        self.assertIsNone(index.seek(0))
+
+    def test_intersects(self):
+        """Test intersection rules."""
+
+        self.assertTrue(intersects(0, 5, 0, 3))
+        self.assertTrue(intersects(0, 5, 4, 8))
+        self.assertTrue(intersects(3, 3, 3, 3))
+        self.assertFalse(intersects(0, 5, 5, 8))
+        self.assertTrue(intersects(3, 3, 0, 5))
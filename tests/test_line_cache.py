@@ -0,0 +1,179 @@
+"""Test line cache."""
+import unittest
+from lib import line_cache
+from lib.line_cache import LineCache, LineCacheStore, get_signature
+
+
+class Position(object):
+    """Position of a text change."""
+
+    def __init__(self, row):
+        """Initialize."""
+
+        self.row = row
+
+
+class TextChange(object):
+    """Text change."""
+
+    def __init__(self, first, last, text):
+        """Initialize."""
+
+        self.a = Position(first)
+        self.b = Position(last)
+        self.str = text
+
+
+class View(object):
+    """View with a change count."""
+
+    def __init__(self, view_id, change_count):
+        """Initialize."""
+
+        self.view_id = view_id
+        self.count = change_count
+
+    def id(self):  # noqa: A003
+        """Get the ID."""
+
+        return self.view_id
+
+    def change_count(self):
+        """Get the change count."""
+
+        return self.count
+
+
+class Buffer(object):
+    """Buffer shown in views."""
+
+    def __init__(self, views):
+        """Initialize."""
+
+        self.buffer_views = views
+
+    def views(self):
+        """Get the views."""
+
+        return self.buffer_views
+
+
+class TestLineCache(unittest.TestCase):
+    """Test line cache."""
+
+    def test_changes(self):
+        """Test the changed rows recorded from the edits to the text."""
+
+        def get_changes(*edits):
+            cache = LineCache(None, {}, 0)
+            for count, edit in enumerate(edits, 1):
+                cache.add_change(*edit, change_count=count)
+            self.assertEqual(cache.changes[1], len(edits))
+            return cache.changes[0]
+
+        # Nothing changed
+        self.assertEqual(get_changes(), (0, -1, 0))
+        # Edit a row
+        self.assertEqual(get_changes((1, 1, 0)), (1, 1, 0))
+        # Insert rows
+        self.assertEqual(get_changes((2, 2, 2)), (2, 4, 2))
+        # Remove rows
+        self.assertEqual(get_changes((1, 3, 0)), (1, 1, -2))
+        # Join rows
+        self.assertEqual(get_changes((1, 2, 0)), (1, 1, -1))
+        # Edits after the changes shift by the rows added before them
+        self.assertEqual(get_changes((1, 1, 2), (6, 6, 0)), (1, 6, 2))
+        # Edits before the changes shift the changes
+        self.assertEqual(get_changes((5, 5, 0), (1, 1, 3)), (1, 8, 3))
+        # Removing the changed rows along with others
+        self.assertEqual(get_changes((3, 3, 2), (2, 6, 0)), (2, 2, -2))
+        # Edits inside the changes
+        self.assertEqual(get_changes((2, 2, 4), (3, 4, 0)), (2, 5, 3))
+
+    def test_changed_rows(self):
+        """Test that the recorded changes map unchanged rows of the new text to their rows in the old text."""
+
+        old = ['r%d' % i for i in range(12)]
+        edits = [(2, 2, 1, ['x', 'y']), (9, 10, 0, ['z']), (0, 0, 0, ['w']), (5, 7, 2, ['p', 'q', 'r'])]
+        new = list(old)
+        cache = LineCache(None, {}, 0)
+        for first, last, rows, text in edits:
+            new[first:last + 1] = text
+            cache.add_change(first, last, rows, 1)
+        first, last, delta = cache.changes[0]
+        for row, line in enumerate(new):
+            if row < first:
+                self.assertEqual(old[row], line)
+            elif row > last:
+                self.assertEqual(old[row - delta], line)
+
+    def test_reuse(self):
+        """Test that lines are only reused outside of the changes and with the same styles."""
+
+        names = ['source.x', 'source.x keyword']
+        rows = [[(0, 2, 1), (2, 5, 0)], [(5, 7, 0), (7, 9, 1)], [(9, 12, 1)]]
+        starts = [0, 5, 9]
+        colors = {'source.x': ('#000000', '#FFFFFF', ''), 'source.x keyword': ('#0000FF', '#FFFFFF', 'bold')}
+
+        def signatures():
+            return [
+                get_signature(runs, start, lambda scope_id: colors[names[scope_id]], None)
+                for runs, start in zip(rows, starts)
+            ]
+
+        cache = LineCache(None, dict(enumerate(zip(signatures(), ['a', 'b', 'c']))), 0)
+        changes = (1, 1, 0)
+        self.assertEqual(
+            [cache.get_line(row, changes, signature) for row, signature in enumerate(signatures())],
+            [cache.lines[0], None, cache.lines[2]]
+        )
+
+        # Change the color of a rule that styles every line
+        colors['source.x keyword'] = ('#FF0000', '#FFFFFF', 'bold')
+        self.assertEqual(
+            [cache.get_line(row, changes, signature) for row, signature in enumerate(signatures())],
+            [None, None, None]
+        )
+
+    def test_store(self):
+        """Test that the least recently used caches are dropped past the limit."""
+
+        def get_cache(size):
+            return LineCache(None, {0: (None, 'y' * (size - line_cache.LINE_OVERHEAD))}, 0)
+
+        store = LineCacheStore(1000)
+        store.put(1, get_cache(400))
+        store.put(2, get_cache(400))
+        self.assertEqual(store.size, 800)
+        # Using a cache keeps it around longer
+        self.assertIsNotNone(store.get(1))
+        store.put(3, get_cache(400))
+        self.assertEqual(sorted(store.caches), [1, 3])
+        # Replacing a cache only counts the new one
+        store.put(3, get_cache(500))
+        self.assertEqual(store.size, 900)
+        # A cache over the limit is not kept
+        store.put(1, get_cache(1001))
+        self.assertEqual(sorted(store.caches), [3])
+        store.pop(3)
+        store.pop(4)
+        self.assertEqual((store.size, len(store.caches)), (0, 0))
+
+    def test_record(self):
+        """Test that the text changes of a buffer are recorded in the caches of its views."""
+
+        store = LineCacheStore(100000)
+        for view_id in (1, 2, 3):
+            store.put(view_id, LineCache(None, {row: (None, 'r%d' % row) for row in range(8)}, 5))
+        # Two views of the edited buffer, one of them without a cache
+        buffer = Buffer([View(1, 7), View(4, 7)])
+        store.record_changes(buffer, [TextChange(2, 2, 'x\ny'), TextChange(6, 7, 'z')])
+        self.assertEqual(store.caches[1].changes, ((2, 6, 0), 7))
+        self.assertEqual(store.caches[2].changes, ((0, -1, 0), 5))
+        # Recording changes doesn't count as a use
+        self.assertEqual(list(store.caches), [1, 2, 3])
+        changes = store.caches[1].changes[0]
+        self.assertEqual(
+            [store.caches[1].get_line(row, changes, None) for row in range(8)],
+            [(None, 'r0'), (None, 'r1'), None, None, None, None, None, (None, 'r7')]
+        )
@@ -0,0 +1,30 @@
+"""Test splitting of native HTML exports."""
+import unittest
+from lib.native import split_lines
+
+
+class TestNative(unittest.TestCase):
+    """Test splitting of native HTML exports."""
+
+    def test_split(self):
+        """Test that spans covering several lines are closed and opened again on each line."""
+
+        self.assertEqual(split_lines('<span a>x</span>'), ['<span a>x</span>'])
+        self.assertEqual(
+            split_lines('<span a>x <span b>/* y\nz */</span></span>\n<span c>w</span>'),
+            [
+                '<span a>x <span b>/* y</span></span>',
+                '<span a><span b>z */</span></span>',
+                '<span c>w</span>'
+            ]
+        )
+
+    def test_empty(self):
+        """Test empty lines and line breaks given as tags."""
+
+        self.assertEqual(split_lines(''), [''])
+        self.assertEqual(split_lines('\n\n'), ['', '', ''])
+        self.assertEqual(
+            split_lines('<span a>x<br>&lt;y&gt;<br/></span>'),
+            ['<span a>x</span>', '<span a>&lt;y&gt;</span>', '<span a></span>']
+        )
@@ -0,0 +1,179 @@
+"""Test line renderer."""
+import re
+import unittest
+from lib.document import Document, StyleTable
+from lib.render import LineRenderer, ChunkedRenderer
+
+OPTIONS = {
+    "tab_size": 4,
+    "disable_nbsp": False,
+    "coalesce_runs": False,
+    "absorb_whitespace": False,
+    "elide_default_style": False,
+    "fground": "#000000",
+    "bground": "#FFFFFF",
+    "table_mode": False
+}
+
+
+def get_renderer(**options):
+    """Get a renderer."""
+
+    opts = dict(OPTIONS)
+    opts.update(options)
+    renderer = LineRenderer(opts)
+    renderer.set_line_template('[%s|%s|%s|%s]', ['  ', ' ', ''], ' ', 2)
+    return renderer
+
+
+def get_lines(count, styles):
+    """Get a document of captured lines."""
+
+    doc = Document()
+    plain = styles.get_style('#000000', '#FFFFFF', '')
+    bold = styles.get_style('#FF0000', None, 'bold')
+    for num in range(1, count + 1):
+        doc.add_run('\n' if num > 1 else '', True, plain)
+        doc.add_run('\tx <%d>' % num, False, bold)
+        doc.add_run('  y', False, bold, ('%d' % num, True) if num % 3 == 0 else None)
+        doc.end_line(False, False, styles.get_color('#FFFFFF'), styles.get_color(None), num)
+    return doc
+
+
+def get_styled_text(code):
+    """Get each encoded character of the rendered code with its span (so where spans are split doesn't matter)."""
+
+    return [
+        (m.group(1), char) for m in re.finditer(r'<span ([^>]*)>((?:[^<&]|&[#\w]+;)*)</span>', code)
+        for char in re.findall(r'&[#\w]+;|.', m.group(2))
+    ]
+
+
+class TestLineRenderer(unittest.TestCase):
+    """Test line renderer."""
+
+    def test_render_line(self):
+        """Test rendering of a captured line."""
+
+        styles = StyleTable()
+        doc = Document()
+        doc.add_run('\tx <1>', False, styles.get_style('#FF0000', None, 'bold'))
+        doc.end_line(False, False, styles.get_color('#FFFFFF'), styles.get_color(None), 7)
+        self.assertEqual(
+            get_renderer().render_document(doc, styles),
+            '[7| 7 |7|<span class="bold real_text" style="background-color: #FFFFFF; color: #FF0000;">'
+            '&nbsp;&nbsp;&nbsp; x &lt;1&gt;</span>]'
+        )
+
+    def test_coalesce(self):
+        """Test that runs with the same style are merged."""
+
+        styles = StyleTable()
+        doc = get_lines(1, styles)
+        self.assertEqual(get_renderer(coalesce_runs=True).render_document(doc, styles).count('<span'), 2)
+
+    def test_chunked(self):
+        """Test that rendering in chunks matches rendering all lines at once."""
+
+        styles = StyleTable()
+        expected = get_renderer().render_document(get_lines(50, styles), styles)
+        out = []
+        chunked = ChunkedRenderer(get_renderer(), styles, out.append, chunk_lines=7)
+        for num in range(1, 51):
+            chunked.doc.add_run('\n' if num > 1 else '', True, 0)
+            chunked.doc.add_run('\tx <%d>' % num, False, 1)
+            chunked.doc.add_run('  y', False, 1, ('%d' % num, True) if num % 3 == 0 else None)
+            chunked.doc.end_line(False, False, 1, 0, num)
+            chunked.check()
+        chunked.flush()
+        self.assertEqual(len(out), 8)
+        self.assertEqual(''.join(out), expected)
+
+    def test_plain_lines(self):
+        """Test that rendering lines of one style in bulk matches rendering each captured line."""
+
+        lines = ['\tx  <1>', '', ' y & z', '']
+        for options in ({}, {"disable_nbsp": True}, {"elide_default_style": True}):
+            for lead in (True, False):
+                styles = StyleTable()
+                doc = Document()
+                for idx, text in enumerate(lines):
+                    if idx or lead or text:
+                        doc.add_run(
+                            ('\n' if idx or lead else '') + text, True, styles.get_style('#000000', '#FFFFFF', '')
+                        )
+                    doc.end_line(False, not text, styles.get_color('#FFFFFF'), styles.get_color(None), idx + 3)
+                self.assertEqual(
+                    get_renderer(**options).render_plain_lines(
+                        '\n'.join(lines), True, lead, '#000000', '#FFFFFF', '', '#FFFFFF', None, 3
+                    ),
+                    get_renderer(**options).render_document(doc, styles)
+                )
+
+    def test_memo(self):
+        """Test that repeated lines are rendered from the memo with the same output."""
+
+        styles = StyleTable()
+        doc = Document()
+        plain = styles.get_style('#000000', '#FFFFFF', '')
+        for num in range(1, 21):
+            doc.add_run('\n\tx  <y>' if num % 2 else '\nz', True, plain)
+            doc.add_run('w', False, plain, ('%d' % num, True) if num % 5 == 0 else None)
+            doc.end_line(False, False, styles.get_color('#FFFFFF'), styles.get_color(None), num)
+        renderer = get_renderer(line_memo_size=1)
+        self.assertEqual(renderer.render_document(doc, styles), get_renderer().render_document(doc, styles))
+        # Lines that open an annotation are not looked up, and one entry only holds the last line
+        self.assertEqual(renderer.memo_lookups, 16)
+        self.assertEqual(renderer.memo_hits, 3)
+        renderer = get_renderer(line_memo_size=2)
+        self.assertEqual(renderer.render_document(doc, styles), get_renderer().render_document(doc, styles))
+        self.assertEqual(renderer.memo_hits, 14)
+
+    def test_codes(self):
+        """Test that the rendered code of each line is kept."""
+
+        styles = StyleTable()
+        renderer = get_renderer()
+        renderer.codes = {}
+        doc = get_lines(10, styles)
+        expected = renderer.render_document(doc, styles)
+        self.assertEqual(sorted(renderer.codes), list(range(1, 11)))
+        self.assertEqual(
+            ''.join(renderer.format_line(renderer.codes[num], None, num) for num in range(1, 11)), expected
+        )
+
+    def test_slices(self):
+        """Test that a line rendered in slices has the same text and styles as the whole line."""
+
+        runs = [('\tx  ', 0), (' ' * 9 + 'a\t \t  b ', 1), ('  ', 0), (' c  ', 1)]
+        line = ''.join([text for text, _ in runs])
+        for options in ({}, {"coalesce_runs": True}, {"disable_nbsp": True}):
+            styles = StyleTable()
+            style_ids = [styles.get_style('#000000', '#FFFFFF', ''), styles.get_style('#FF0000', None, 'bold')]
+            doc = Document()
+            for text, style in runs:
+                doc.add_run(text, not len(doc.parts), style_ids[style])
+            renderer = get_renderer(**options)
+            expected = renderer.render_runs(doc, styles, 0, len(runs), False) + renderer.finish_line('', False)
+
+            for size in range(1, 8):
+                renderer = get_renderer(**options)
+                rendered = []
+                for start in range(0, len(line), size):
+                    # Capture the runs of the slice, cutting the runs that cross its edges
+                    doc = Document()
+                    begin = 0
+                    for text, style in runs:
+                        end = begin + len(text)
+                        if begin < start + size and end > start:
+                            first = max(begin, start)
+                            doc.add_run(line[first:min(end, start + size)], first == 0, style_ids[style])
+                            if start + size < end and line[start + size] in ' \t':
+                                doc.set_space_next()
+                        begin = end
+                    code = [renderer.render_runs(doc, styles, 0, doc.run_count(), False)]
+                    renderer.flush_text(code, False)
+                    # Nothing is held back past the end of the slice
+                    self.assertIsNone(renderer.pending_text)
+                    rendered.append(''.join(code))
+                self.assertEqual(get_styled_text(''.join(rendered)), get_styled_text(expected))
@@ -0,0 +1,118 @@
+"""Test scope runs."""
+import unittest
+from . import sublime
+from lib.scope_runs import get_scope_runs, resolve_engine, single_scope, sample_scope
+
+# `x = "ab" if 1 else 2` with nested scopes inside one outer scope
+SOURCE = 'source.x '
+SCOPES = (
+    [SOURCE + 'variable '] + [SOURCE] * 3 + [SOURCE + 'string '] * 4 + [SOURCE] +
+    [SOURCE + 'keyword '] * 2 + [SOURCE] + [SOURCE + 'constant.numeric '] + [SOURCE] +
+    [SOURCE + 'keyword '] * 4 + [SOURCE] + [SOURCE + 'constant.numeric ']
+)
+
+
+class View(object):
+    """View with the scopes of each character."""
+
+    def __init__(self, scopes, tokens=False):
+        """Initialize."""
+
+        self.scopes = scopes
+        if tokens:
+            self.extract_tokens_with_scopes = self.tokens
+
+    def scope_name(self, pt):
+        """Get the scope of the character."""
+
+        return self.scopes[pt]
+
+    def tokens(self, region):
+        """Get a token per character."""
+
+        return [
+            (sublime.Region(pt, pt + 1), self.scopes[pt]) for pt in range(region.begin(), region.end())
+        ]
+
+
+class TokenView(View):
+    """View with the given tokens, whatever region is asked for."""
+
+    def __init__(self, scopes, tokens):
+        """Initialize."""
+
+        super().__init__(scopes)
+        self.token_list = [(sublime.Region(a, b), scope) for a, b, scope in tokens]
+        self.extract_tokens_with_scopes = lambda region: self.token_list
+
+
+class TestScopeRuns(unittest.TestCase):
+    """Test scope runs."""
+
+    def test_resolve(self):
+        """Test that engines resolve to what the view supports."""
+
+        self.assertEqual(resolve_engine(View(SCOPES), 'auto'), 'char')
+        self.assertEqual(resolve_engine(View(SCOPES), 'tokens'), 'char')
+        self.assertEqual(resolve_engine(View(SCOPES, True), 'auto'), 'tokens')
+        self.assertEqual(resolve_engine(View(SCOPES, True), 'char'), 'char')
+
+    def test_nested(self):
+        """Test that nested scopes inside an outer scope are kept as runs of their own."""
+
+        expected = get_scope_runs(View(SCOPES), 0, len(SCOPES), 'char')
+        self.assertEqual(len(expected), 11)
+        view = View(SCOPES, True)
+        self.assertEqual(get_scope_runs(view, 0, len(SCOPES), resolve_engine(view, 'auto')), expected)
+
+
+class TestSingleScope(unittest.TestCase):
+    """Test single scope checks."""
+
+    def test_split(self):
+        """Test that a scope split over several tokens is found, and several scopes are not."""
+
+        text = 'text.plain '
+        view = TokenView([text] * 10, [(0, 3, text), (3, 4, text), (4, 10, text)])
+        self.assertEqual(single_scope(view, 0, 10, 'tokens'), text)
+        view = TokenView([text] * 10, [(0, 3, text), (3, 4, SOURCE), (4, 10, text)])
+        self.assertIsNone(single_scope(view, 0, 10, 'tokens'))
+
+    def test_gaps(self):
+        """Test that tokens that leave gaps in the range are not taken as a single scope."""
+
+        text = 'text.plain '
+        for tokens in (
+            [(0, 3, text), (4, 10, text)],
+            [(1, 10, text)],
+            [(0, 9, text)],
+            []
+        ):
+            self.assertIsNone(single_scope(TokenView([text] * 10, tokens), 0, 10, 'tokens'))
+
+    def test_past_range(self):
+        """Test that tokens that extend past the range are accepted."""
+
+        text = 'text.plain '
+        view = TokenView([text] * 20, [(0, 8, text), (8, 20, text)])
+        self.assertEqual(single_scope(view, 5, 12, 'tokens'), text)
+        self.assertIsNone(single_scope(view, 5, 5, 'tokens'))
+
+    def test_char(self):
+        """Test single scope checks by walking the characters."""
+
+        self.assertEqual(single_scope(View([SOURCE] * 5), 0, 5), SOURCE)
+        self.assertIsNone(single_scope(View(SCOPES), 0, len(SCOPES)))
+        self.assertEqual(single_scope(View(SCOPES), 1, 4), SOURCE)
+
+    def test_sample(self):
+        """Test sampling the scopes of a range."""
+
+        self.assertEqual(sample_scope(View([SOURCE] * 100), 0, 100, 10), SOURCE)
+        self.assertIsNone(sample_scope(View([SOURCE] * 100), 0, 0, 10))
+        # A sample lands on the other scope
+        self.assertIsNone(sample_scope(View([SOURCE] * 50 + [SOURCE + 'string '] + [SOURCE] * 49), 0, 100, 10))
+        # The last character is always sampled
+        self.assertIsNone(sample_scope(View([SOURCE] * 99 + [SOURCE + 'string ']), 0, 100, 10))
+        # Runs between the samples are missed
+        self.assertEqual(sample_scope(View([SOURCE] * 55 + [SOURCE + 'string '] + [SOURCE] * 44), 0, 100, 10), SOURCE)
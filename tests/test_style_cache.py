@@ -0,0 +1,57 @@
+"""Test style cache."""
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from lib.style_cache import StyleCache
+
+STYLES = {"source.python keyword": [["#0000FF", "#FFFFFF", "bold"], ["#FFFFFF", "#0000FF", "bold"]]}
+
+
+class TestStyleCache(unittest.TestCase):
+    """Test style cache."""
+
+    def setUp(self):
+        """Setup."""
+
+        self.directory = os.path.join(tempfile.mkdtemp(), 'styles')
+
+    def tearDown(self):
+        """Cleanup."""
+
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def test_load(self):
+        """Test that saved styles are loaded for the same key only."""
+
+        cache = StyleCache(self.directory, 4)
+        self.assertEqual(cache.load(["scheme", "filter"]), {})
+        cache.save(["scheme", "filter"], STYLES)
+        self.assertEqual(cache.load(["scheme", "filter"]), STYLES)
+        self.assertEqual(cache.load(["scheme", ""]), {})
+
+    def test_corrupt(self):
+        """Test that a damaged file is ignored."""
+
+        cache = StyleCache(self.directory, 4)
+        cache.save(["scheme"], STYLES)
+        with open(os.path.join(self.directory, os.listdir(self.directory)[0]), 'w') as f:
+            f.write('{"key": ')
+        self.assertEqual(cache.load(["scheme"]), {})
+
+    def test_prune(self):
+        """Test that the least recently used keys are removed past the size limit."""
+
+        cache = StyleCache(self.directory, 2)
+        cache.save(["a"], STYLES)
+        cache.save(["b"], STYLES)
+        # Use "a" after "b" was saved
+        past = time.time() - 10
+        os.utime(cache.get_path(["b"]), (past, past))
+        cache.load(["a"])
+        cache.save(["c"], STYLES)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(cache.load(["a"]), STYLES)
+        self.assertEqual(cache.load(["b"]), {})
+        self.assertEqual(cache.load(["c"]), STYLES)
@@ -0,0 +1,69 @@
+"""Test pipelined writer."""
+import unittest
+import io
+from lib.writer import PipelinedWriter, CountingWriter
+
+
+class FailingFile(object):
+    """File that fails on write."""
+
+    def write(self, text):
+        """Fail to write."""
+
+        raise IOError('disk full')
+
+
+class TestPipelinedWriter(unittest.TestCase):
+    """Test pipelined writer."""
+
+    def test_output_order(self):
+        """Test that all output is written in order."""
+
+        out = io.StringIO()
+        with PipelinedWriter(out, batch_size=10, queue_size=2) as writer:
+            for i in range(1000):
+                writer.write('%d,' % i)
+        self.assertEqual(out.getvalue(), ''.join('%d,' % i for i in range(1000)))
+
+    def test_small_output(self):
+        """Test that output smaller than a batch is flushed on close."""
+
+        out = io.StringIO()
+        with PipelinedWriter(out) as writer:
+            writer.write('abc')
+        self.assertEqual(out.getvalue(), 'abc')
+
+    def test_error(self):
+        """Test that errors in the writer thread are raised to the producer."""
+
+        writer = PipelinedWriter(FailingFile(), batch_size=1, queue_size=1)
+        with self.assertRaises(IOError):
+            for _ in range(100):
+                writer.write('x')
+            writer.close()
+        writer.close()
+        self.assertFalse(writer.thread.is_alive())
+
+    def test_producer_error(self):
+        """Test that an error raised by the producer is not replaced by the writer thread's error."""
+
+        with self.assertRaises(KeyError):
+            with PipelinedWriter(FailingFile(), batch_size=1, queue_size=1) as writer:
+                writer.write('x')
+                raise KeyError('cancelled')
+        self.assertFalse(writer.thread.is_alive())
+
+
+class TestCountingWriter(unittest.TestCase):
+    """Test counting writer."""
+
+    def test_count(self):
+        """Test that written bytes are counted and passed through."""
+
+        out = io.StringIO()
+        writer = CountingWriter(out)
+        writer.write('abc')
+        writer.write('')
+        writer.write('d\u00e9\u20ac')
+        self.assertEqual(writer.written, 9)
+        self.assertEqual(out.getvalue(), 'abcd\u00e9\u20ac')